@@ -0,0 +1,85 @@
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import PurePath
+from context import Context
+
+LAST_BROKER_FILE: str = "last_broker.json"
+
+
+class BrokerFinder:
+    """
+    probes all configured brokers at once, so the startup doesn't wait for the unreachable ones.
+    the broker we were connected to last time is kept in the workspace and preferred on the next boot.
+    config (optional): network.mqtt.probe_timeout in secs (default 2)
+    """
+
+    def __init__(self, my_context: Context):
+        self.__my_context = my_context
+        self.__path = PurePath(my_context.WORKSPACE, LAST_BROKER_FILE)
+        self.__timeout: float = float(my_context.configs["network"]["mqtt"].get("probe_timeout", 2))
+        self.__last_broker: str | None = self.__load()
+
+    def find(self) -> [str]:
+        """
+        opens a tcp connection to every broker in parallel.
+        returns as soon as the last good broker has answered, or - when it hasn't - the first one that did.
+        :return: the brokers to try, in this order. empty when none of them answered.
+        """
+        brokers: [str] = self.__my_context.configs["network"]["mqtt"]["broker"]
+        preferred: str | None = self.__last_broker if self.__last_broker in brokers else None
+        reachable: [str] = []
+        executor = ThreadPoolExecutor(max_workers=len(brokers), thread_name_prefix="probe")
+        futures = {executor.submit(self.__probe, broker): broker for broker in brokers}
+        try:
+            for future in as_completed(futures):
+                broker = futures[future]
+                latency: float | None = future.result()
+                if latency is None:
+                    if broker == preferred:
+                        preferred = None
+                else:
+                    self.__my_context.log.debug(f"broker '{broker}' answered after {round(latency * 1000)} ms")
+                    reachable.append(broker)
+                if preferred in reachable:
+                    reachable.remove(preferred)
+                    reachable.insert(0, preferred)
+                    break
+                if reachable and preferred is None:
+                    break
+        finally:
+            # we don't wait for the slow ones
+            executor.shutdown(wait=False, cancel_futures=True)
+        return reachable
+
+    def remember(self, broker: str):
+        """
+        keeps the broker for the next boot
+        """
+        if broker == self.__last_broker:
+            return
+        self.__last_broker = broker
+        try:
+            with open(self.__path, "w") as file:
+                json.dump({"broker": broker}, file)
+        except OSError as ose:
+            self.__my_context.log.warning(f"couldn't write {self.__path} - {ose}")
+
+    def __load(self) -> str | None:
+        try:
+            with open(self.__path) as file:
+                return json.load(file).get("broker")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def __probe(self, broker: str) -> float | None:
+        """
+        :return: secs until the tcp connection was established. None if it couldn't be established.
+        """
+        started: float = time.monotonic()
+        try:
+            with socket.create_connection((broker, self.__my_context.MQTT_PORT), timeout=self.__timeout):
+                return time.monotonic() - started
+        except OSError:
+            return None
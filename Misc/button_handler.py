@@ -1,16 +1,14 @@
-import json
-
 from context import Context
 from gpiozero import Button
-import paho.mqtt.client as mqtt
+from Misc.publisher import Publisher
 
 MQTT_REPORT_EVENT: str = "/status"
 
 
 class ButtonHandler:
-    def __init__(self, mqtt_client: mqtt.Client, my_context: Context):
+    def __init__(self, publisher: Publisher, my_context: Context):
         self.__my_context = my_context
-        self.__mqtt_client = mqtt_client
+        self.__publisher = publisher
         gpio_btn01: str = self.__my_context.configs["hardware"]["buttons"]["btn01"]
         # debounce: float = self.__my_context.configs["hardware"]["buttons"]["debounce"]
         gpio_btn02: str = self.__my_context.configs["hardware"]["buttons"]["btn02"]
@@ -34,9 +32,8 @@ class ButtonHandler:
         self.__report_event("btn02", "up")
 
     def __report_event(self, button: str, state: str):
-        if not self.__mqtt_client.is_connected():
+        if not self.__publisher.is_connected():
             return
         event = {"button": state}
         self.__my_context.log.debug(f"{button} {state}")
-        self.__mqtt_client.publish(self.__my_context.MQTT_OUTBOUND + "/" + button, json.dumps(event),
-                                   self.__my_context.MQTT_BUTTON_QOS, False)
+        self.__publisher.publish("/" + button, event, self.__my_context.MQTT_BUTTON_QOS)
@@ -0,0 +1,218 @@
+"""
+compact binary payloads for commands and events. a small MessagePack codec (the types json knows,
+plus bytes) - so we don't need another package on the agent.
+binary payloads are marked by the topic suffix ".mp" (e.g. <root>/cmd/<id>/visual.mp) or,
+with MQTT v5, by the content type "application/msgpack". everything else is json, as before.
+"""
+import json
+import struct
+
+SUFFIX: str = ".mp"
+CONTENT_TYPE: str = "application/msgpack"
+JSON: str = "json"
+MSGPACK: str = "msgpack"
+
+
+def packb(obj) -> bytes:
+    """
+    :return: the MessagePack representation of obj
+    """
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def unpackb(data: bytes):
+    """
+    :return: the object in data. ValueError when data is not a single valid MessagePack object.
+    """
+    try:
+        obj, offset = _unpack(memoryview(data), 0)
+    except (IndexError, struct.error) as ex:
+        raise ValueError(f"truncated msgpack data - {ex}")
+    if offset != len(data):
+        raise ValueError(f"extra data after offset {offset}")
+    return obj
+
+
+def decode(topic: str, payload: bytes, content_type: str | None = None) -> (str, object):
+    """
+    :param topic: of the incoming message. the last level is the command.
+    :param content_type: MQTT v5 content type property, if any
+    :return: the command (without suffix) and its parameters
+    """
+    cmd: str = topic.rsplit('/', 1)[1]
+    if cmd.endswith(SUFFIX):
+        return cmd[:-len(SUFFIX)], unpackb(payload)
+    if content_type == CONTENT_TYPE:
+        return cmd, unpackb(payload)
+    return cmd, json.loads(payload.decode('UTF-8'))
+
+
+def encode(obj, encoding: str = JSON) -> (str, bytes | str):
+    """
+    :param encoding: json or msgpack
+    :return: the suffix for the topic and the payload
+    """
+    if encoding == MSGPACK:
+        return SUFFIX, packb(obj)
+    return "", json.dumps(obj)
+
+
+def _pack(obj, out: bytearray):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, float):
+        # float32 when it doesn't lose anything
+        try:
+            single: bytes | None = struct.pack(">f", obj)
+        except OverflowError:
+            # finite, but beyond the float32 range
+            single = None
+        if single is not None and (struct.unpack(">f", single)[0] == obj or obj != obj):
+            out.append(0xca)
+            out += single
+        else:
+            out.append(0xcb)
+            out += struct.pack(">d", obj)
+    elif isinstance(obj, str):
+        data: bytes = obj.encode("UTF-8")
+        _pack_header(len(data), out, 0xa0, 32, 0xd9, 0xda, 0xdb)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_header(len(obj), out, None, 0, 0xc4, 0xc5, 0xc6)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        _pack_header(len(obj), out, 0x90, 16, None, 0xdc, 0xdd)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        _pack_header(len(obj), out, 0x80, 16, None, 0xde, 0xdf)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"can't pack {type(obj).__name__}")
+
+
+def _pack_int(value: int, out: bytearray):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif value >= 0:
+        for code, fmt, limit in ((0xcc, ">B", 1 << 8), (0xcd, ">H", 1 << 16), (0xce, ">I", 1 << 32),
+                                 (0xcf, ">Q", 1 << 64)):
+            if value < limit:
+                out.append(code)
+                out += struct.pack(fmt, value)
+                return
+        raise OverflowError(f"{value} is too large")
+    else:
+        for code, fmt, limit in ((0xd0, ">b", 1 << 7), (0xd1, ">h", 1 << 15), (0xd2, ">i", 1 << 31),
+                                 (0xd3, ">q", 1 << 63)):
+            if value >= -limit:
+                out.append(code)
+                out += struct.pack(fmt, value)
+                return
+        raise OverflowError(f"{value} is too small")
+
+
+def _pack_header(length: int, out: bytearray, fix: int | None, fix_limit: int,
+                 code8: int | None, code16: int, code32: int):
+    if fix is not None and length < fix_limit:
+        out.append(fix | length)
+    elif code8 is not None and length < 1 << 8:
+        out.append(code8)
+        out.append(length)
+    elif length < 1 << 16:
+        out.append(code16)
+        out += struct.pack(">H", length)
+    else:
+        out.append(code32)
+        out += struct.pack(">I", length)
+
+
+# code -> (struct format, size) of the fixed size types
+_FIXED = {
+    0xca: (">f", 4), 0xcb: (">d", 8),
+    0xcc: (">B", 1), 0xcd: (">H", 2), 0xce: (">I", 4), 0xcf: (">Q", 8),
+    0xd0: (">b", 1), 0xd1: (">h", 2), 0xd2: (">i", 4), 0xd3: (">q", 8),
+}
+# code -> size of the length field
+_STR = {0xd9: 1, 0xda: 2, 0xdb: 4}
+_BIN = {0xc4: 1, 0xc5: 2, 0xc6: 4}
+_ARRAY = {0xdc: 2, 0xdd: 4}
+_MAP = {0xde: 2, 0xdf: 4}
+
+
+def _length(data: memoryview, offset: int, size: int) -> (int, int):
+    return int.from_bytes(data[offset:offset + size], "big"), offset + size
+
+
+def _unpack(data: memoryview, offset: int) -> (object, int):
+    code: int = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code <= 0xbf:
+        return _unpack_str(data, offset, code & 0x1f)
+    if 0x90 <= code <= 0x9f:
+        return _unpack_array(data, offset, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return _unpack_map(data, offset, code & 0x0f)
+    if code == 0xc0:
+        return None, offset
+    if code == 0xc2:
+        return False, offset
+    if code == 0xc3:
+        return True, offset
+    if code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, offset)[0], offset + size
+    if code in _STR:
+        length, offset = _length(data, offset, _STR[code])
+        return _unpack_str(data, offset, length)
+    if code in _BIN:
+        length, offset = _length(data, offset, _BIN[code])
+        if offset + length > len(data):
+            raise IndexError("bin")
+        return bytes(data[offset:offset + length]), offset + length
+    if code in _ARRAY:
+        length, offset = _length(data, offset, _ARRAY[code])
+        return _unpack_array(data, offset, length)
+    if code in _MAP:
+        length, offset = _length(data, offset, _MAP[code])
+        return _unpack_map(data, offset, length)
+    raise ValueError(f"unsupported msgpack type 0x{code:02x}")
+
+
+def _unpack_str(data: memoryview, offset: int, length: int) -> (str, int):
+    if offset + length > len(data):
+        raise IndexError("str")
+    return str(data[offset:offset + length], "UTF-8"), offset + length
+
+
+def _unpack_array(data: memoryview, offset: int, length: int) -> (list, int):
+    items = []
+    for i in range(length):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data: memoryview, offset: int, length: int) -> (dict, int):
+    items = {}
+    for i in range(length):
+        key, offset = _unpack(data, offset)
+        value, offset = _unpack(data, offset)
+        items[key] = value
+    return items, offset
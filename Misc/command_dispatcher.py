@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import deque
+from context import Context
+from Misc.histogram import Histogram
+from PinHandler.pin_handler import ALL_LEDS, ALL_SIRENS
+
+# command -> subsystem. every subsystem has its own worker, so a slow command (e.g. play)
+# doesn't hold up the others. the order within a subsystem is kept.
+SUBSYSTEMS: [str, str] = {
+    "visual": "pins",
+    "acoustic": "pins",
+    "paged": "lcd",
+    "paged_patch": "lcd",
+    "play": "audio",
+    "rfid": "rfid",
+    "timers": "state",
+    "vars": "state",
+    "loglevel": "state",
+    "reset_status": "state",
+    "status": "state",
+    # stops the other subsystems while it runs, see CommandDispatcher.__serve
+    "batch": "state",
+}
+# queue item that tells when the worker has got there and holds it until it is released
+BARRIER: str = "_barrier"
+# upper bounds of the service time buckets in ms
+SERVICE_TIME_BUCKETS: [float] = [1, 5, 10, 50, 100, 500, 1000]
+
+
+def merge_vars(older: dict, newer: dict) -> dict:
+    return {**older, **newer}
+
+
+def replace_paged(older: dict, newer: dict) -> dict:
+    # every paged message rebuilds the whole display
+    return newer
+
+
+def resolve_selectors(message: dict) -> dict:
+    """
+    replaces led_all and sir_all by the single pins - the way the PinHandler reads them:
+    a selector's scheme wins over the single pins of the message, a selector's "off" only applies to the others.
+    """
+    resolved = dict(message)
+    for selector, pins in [("led_all", ALL_LEDS), ("sir_all", ALL_SIRENS)]:
+        if selector not in resolved:
+            continue
+        value = resolved.pop(selector)
+        for pin in pins:
+            if str(value).lower() != "off" or pin not in resolved:
+                resolved[pin] = value
+    return resolved
+
+
+def merge_visual(older: dict, newer: dict) -> dict | None:
+    """
+    one visual message that has the same effect as the older followed by the newer one
+    """
+    if "progress" in newer:
+        # the leds are switched off anyway. but a progress message can't carry the sirens of the older one.
+        return newer if all(key in ALL_LEDS or key in ["led_all", "progress"] for key in older) else None
+    if "progress" in older:
+        # the progress bar switched the leds off and will be stopped by the newer message
+        return {"led_all": "off", **newer}
+    merged = {**resolve_selectors(older), **resolve_selectors(newer)}
+    # back to the selectors where all pins are the same
+    for selector, pins in [("led_all", ALL_LEDS), ("sir_all", ALL_SIRENS)]:
+        values = [merged.get(pin) for pin in pins]
+        if values[0] is not None and values.count(values[0]) == len(values):
+            merged = {key: value for key, value in merged.items() if key not in pins}
+            merged[selector] = values[0]
+    return merged
+
+
+# command -> function to merge a queued message with a newer one of the same command.
+# returns None when they can't be merged.
+COALESCE = {
+    "vars": merge_vars,
+    "paged": replace_paged,
+    "visual": merge_visual,
+}
+
+
+class CommandWorker(threading.Thread):
+    """
+    serves the commands of one subsystem in the order they came in.
+    when the last queued command hasn't been started yet, a newer one of the same kind is merged into it.
+    """
+
+    def __init__(self, subsystem: str, handler):
+        threading.Thread.__init__(self, name=f"cmd-{subsystem}")
+        self.__handler = handler
+        self.__condition = threading.Condition()
+        # [cmd, params, monotonic expiry time or None]
+        self.__queue: deque = deque()
+        self.max_depth: int = 0
+        self.coalesced: int = 0
+        # dropped, as they had expired before we got to them
+        self.expired: int = 0
+        # barriers in the queue. they are no commands, so they don't count for the depth.
+        self.__barriers: int = 0
+        # stopped at a barrier (while a batch runs)
+        self.paused: bool = False
+        self.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self.__queue) - self.__barriers
+
+    def pause(self) -> threading.Event:
+        """
+        waits until the worker has served everything that has been queued so far.
+        the worker stops there and doesn't take anything newer until the returned event is set.
+        """
+        reached, release = threading.Event(), threading.Event()
+        with self.__condition:
+            self.__queue.append([BARRIER, (reached, release), None])
+            self.__barriers += 1
+            self.__condition.notify()
+        reached.wait()
+        return release
+
+    def put(self, cmd: str, params, expires_at: float | None = None):
+        with self.__condition:
+            tail = self.__queue[-1] if self.__queue else None
+            merged = COALESCE[cmd](tail[1], params) if tail and tail[0] == cmd and cmd in COALESCE else None
+            if merged is not None:
+                tail[1] = merged
+                tail[2] = expires_at
+                self.coalesced += 1
+            else:
+                self.__queue.append([cmd, params, expires_at])
+                self.max_depth = max(self.max_depth, self.depth)
+            self.__condition.notify()
+
+    def run(self):
+        while True:
+            with self.__condition:
+                while not self.__queue:
+                    self.__condition.wait()
+                cmd, params, expires_at = self.__queue.popleft()
+                if cmd == BARRIER:
+                    self.__barriers -= 1
+            if cmd == BARRIER:
+                reached, release = params
+                self.paused = True
+                reached.set()
+                release.wait()
+                self.paused = False
+                continue
+            if expires_at is not None and time.monotonic() > expires_at:
+                self.expired += 1
+                continue
+            self.__handler(cmd, params)
+
+
+class CommandDispatcher:
+    """
+    takes the commands off the paho network thread and hands them over to the workers of the subsystems
+    """
+
+    def __init__(self, my_context: Context, handler):
+        """
+        :param handler: called with (cmd, params) on the worker of the command's subsystem
+        """
+        self.__my_context = my_context
+        self.__handler = handler
+        self.__service_times: [str, Histogram] = {}
+        self.__lock = threading.Lock()
+        self.__workers: [str, CommandWorker] = {
+            subsystem: CommandWorker(subsystem, self.__serve)
+            for subsystem in sorted(set(SUBSYSTEMS.values()))
+        }
+
+    def dispatch(self, cmd: str, params, expires_at: float | None = None):
+        """
+        returns immediately. unknown commands end up on the state worker.
+        :param expires_at: monotonic time. the command is dropped when it hasn't been started until then.
+        """
+        self.__workers[SUBSYSTEMS.get(cmd, "state")].put(cmd, params, expires_at)
+
+    def __serve(self, cmd: str, params):
+        if cmd != "batch":
+            self.__timed(cmd, params)
+            return
+        # a batch is applied after everything that came in before it - and before everything that came in later.
+        # so the other workers stand still until it is done.
+        releases: [threading.Event] = [worker.pause() for subsystem, worker in self.__workers.items()
+                                       if subsystem != SUBSYSTEMS["batch"]]
+        try:
+            self.__timed(cmd, params)
+        finally:
+            for release in releases:
+                release.set()
+
+    def __timed(self, cmd: str, params):
+        started: float = time.monotonic()
+        try:
+            self.__handler(cmd, params)
+        except Exception as ex:
+            message = "An exception of type {0} occurred. Arguments:\n{1!r}".format(type(ex).__name__, ex.args)
+            self.__my_context.log.warning(f"{message}")
+            self.__my_context.log.warning(f"exception occurred while processing '{cmd}'. Ignoring it.")
+        with self.__lock:
+            if cmd not in self.__service_times:
+                self.__service_times[cmd] = Histogram(SERVICE_TIME_BUCKETS)
+            histogram = self.__service_times[cmd]
+        histogram.add((time.monotonic() - started) * 1000)
+
+    def stats(self, reset: bool = True) -> dict:
+        """
+        :param reset: starts over with the max depths and service times
+        :return: queue depths of the subsystems and service times of the commands in ms
+        """
+        queues = {subsystem: {"depth": worker.depth, "max_depth": worker.max_depth, "coalesced": worker.coalesced,
+                              "expired": worker.expired, "paused": worker.paused}
+                  for subsystem, worker in self.__workers.items()}
+        with self.__lock:
+            service_ms = {cmd: histogram.as_dict() for cmd, histogram in self.__service_times.items()}
+            if reset:
+                self.__service_times.clear()
+        if reset:
+            for worker in self.__workers.values():
+                worker.max_depth = worker.depth
+        return {"queues": queues, "service_ms": service_ms}
@@ -0,0 +1,50 @@
+import threading
+
+
+class Histogram:
+    """
+    counts values (e.g. latencies in secs) in fixed buckets for the status message
+    """
+
+    def __init__(self, bounds: [float]):
+        """
+        :param bounds: ascending upper bounds of the buckets. larger values are counted in "+inf".
+        """
+        self.__lock = threading.Lock()
+        self.__bounds: [float] = sorted(bounds)
+        self.__counts: [int] = []
+        self.__sum: float = 0
+        self.__max: float = 0
+        self.reset()
+
+    def add(self, value: float):
+        with self.__lock:
+            index = next((i for i, bound in enumerate(self.__bounds) if value <= bound), len(self.__bounds))
+            self.__counts[index] += 1
+            self.__sum += value
+            self.__max = max(self.__max, value)
+
+    def reset(self):
+        with self.__lock:
+            self.__counts = [0] * (len(self.__bounds) + 1)
+            self.__sum = 0
+            self.__max = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.__counts)
+
+    def as_dict(self) -> dict:
+        """
+        :return: e.g. {"buckets": {"1": 3, "5": 1, "+inf": 0}, "count": 4, "mean": 1.2, "max": 3.9}
+        """
+        with self.__lock:
+            count = sum(self.__counts)
+            buckets = {f"{bound:g}": n for bound, n in zip(self.__bounds, self.__counts)}
+            buckets["+inf"] = self.__counts[-1]
+            return {
+                "buckets": buckets,
+                "count": count,
+                "mean": round(self.__sum / count, 3) if count else 0,
+                "max": round(self.__max, 3)
+            }
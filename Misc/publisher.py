@@ -0,0 +1,64 @@
+import threading
+import time
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from context import Context
+from Misc import codec
+
+# user property with the time (epoch secs) a message was sent. set by us and by the game server.
+SENT_AT: str = "sent_at"
+
+
+class Publisher:
+    """
+    sends our events and the status. encodes them (see Misc/codec.py) and, with MQTT v5,
+    replaces the topics by topic aliases and adds the send time as a user property.
+    """
+
+    def __init__(self, mqtt_client: mqtt.Client, my_context: Context):
+        self.__mqtt_client = mqtt_client
+        self.__my_context = my_context
+        self.__lock = threading.Lock()
+        # topic -> alias. the aliases are only valid for the current connection.
+        self.__aliases: [str, int] = {}
+        self.__alias_maximum: int = 0
+
+    def is_connected(self) -> bool:
+        return self.__mqtt_client.is_connected()
+
+    def connected(self, properties: Properties | None):
+        """
+        called by on_connect. starts over with the aliases, as far as the broker allows them.
+        """
+        with self.__lock:
+            self.__aliases.clear()
+            self.__alias_maximum = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+        self.__my_context.log.debug(f"broker allows {self.__alias_maximum} topic aliases")
+
+    def publish(self, sub_topic: str, obj, qos: int, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        """
+        :param sub_topic: below our outbound topic, e.g. /status
+        :param obj: the event - encoded as json or msgpack (network.mqtt.encoding)
+        """
+        suffix, payload = codec.encode(obj, self.__my_context.MQTT_ENCODING)
+        topic: str = self.__my_context.MQTT_OUTBOUND + sub_topic + suffix
+        if not self.__my_context.MQTT_V5:
+            return self.__mqtt_client.publish(topic, payload, qos, retain)
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.UserProperty = [(SENT_AT, f"{time.time():.3f}")]
+        if suffix:
+            properties.ContentType = codec.CONTENT_TYPE
+        # the alias has to be known to the broker before we send it alone - so we keep the order
+        with self.__lock:
+            # only for qos 0. paho would resend other messages after a reconnect - with an alias from the old connection
+            alias: int | None = self.__aliases.get(topic) if qos == 0 else None
+            if alias is not None:
+                properties.TopicAlias = alias
+                topic = ""
+            elif qos == 0 and len(self.__aliases) < self.__alias_maximum:
+                alias = len(self.__aliases) + 1
+                self.__aliases[topic] = alias
+                # the first message carries the topic and the alias
+                properties.TopicAlias = alias
+            return self.__mqtt_client.publish(topic, payload, qos, retain, properties)
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+import paho.mqtt.client as mqtt
+from context import Context
+
+
+class ReconnectSupervisor(threading.Thread):
+    """
+    brings the mqtt connection back after it has been lost. the paho callbacks only signal us,
+    so the network thread never blocks. retries back off exponentially (with jitter, up to a cap).
+    after some failed attempts on the same broker we fail over to the next one of the config.
+    config (all optional): network.mqtt.reconnect {"min_delay": 1, "max_delay": 60, "attempts_per_broker": 3}
+    """
+
+    def __init__(self, mqtt_client: mqtt.Client, my_context: Context, on_retry=None):
+        """
+        :param on_retry: called before every attempt, e.g. to show the wi-fi signal
+        """
+        threading.Thread.__init__(self)
+        self.__mqtt_client = mqtt_client
+        self.__my_context = my_context
+        self.__on_retry = on_retry
+        reconnect: dict = self.__my_context.configs["network"]["mqtt"].get("reconnect", {})
+        self.__min_delay: float = float(reconnect.get("min_delay", 1))
+        self.__max_delay: float = float(reconnect.get("max_delay", 60))
+        self.__attempts_per_broker: int = int(reconnect.get("attempts_per_broker", 3))
+        self.__lost = threading.Event()
+        self.__connected = threading.Event()
+        # monotonic time when the connection was lost. None while connected.
+        self.__disconnected_at: float | None = None
+        self.start()
+
+    def disconnected(self):
+        """
+        called by on_disconnect. returns immediately.
+        """
+        if self.__disconnected_at is None:
+            self.__disconnected_at = time.monotonic()
+        self.__connected.clear()
+        self.__lost.set()
+
+    def connected(self):
+        """
+        called by on_connect. records how long the agent has been offline.
+        """
+        if self.__disconnected_at is not None:
+            self.__my_context.reconnect_latency.add(time.monotonic() - self.__disconnected_at)
+            self.__disconnected_at = None
+        self.__connected.set()
+
+    def wait_connected(self, timeout: float) -> bool:
+        """
+        :return: True when the broker has accepted the connection within timeout secs
+        """
+        return self.__connected.wait(timeout)
+
+    def run(self):
+        self.__my_context.log.debug("Reconnect Supervisor starting")
+        while True:
+            self.__lost.wait()
+            self.__lost.clear()
+            if self.__connected.is_set():
+                # already back again
+                continue
+            # paho's own network thread would start reconnecting by itself. we do that here.
+            self.__mqtt_client.loop_stop()
+            self.__reconnect()
+
+    def __reconnect(self):
+        brokers: [str] = self.__my_context.configs["network"]["mqtt"]["broker"]
+        broker: str = self.__my_context.mqtt_broker
+        attempt: int = 0
+        # failed attempts on the current broker
+        on_broker: int = 0
+        while not self.__connected.is_set():
+            delay: float = min(self.__max_delay, self.__min_delay * 2 ** attempt)
+            # equal jitter - half the delay plus a random share of the other half.
+            # so a field full of agents doesn't hit the broker at the same time.
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+            on_broker += 1
+            if self.__on_retry:
+                self.__on_retry()
+            try:
+                if on_broker > self.__attempts_per_broker and len(brokers) > 1:
+                    # fail over to the next broker. the backoff goes on, as the network itself may be down.
+                    broker = brokers[(brokers.index(broker) + 1) % len(brokers)] if broker in brokers else brokers[0]
+                    on_broker = 1
+                    self.__my_context.log.info(f"failing over to broker: '{broker}'")
+                    self.__my_context.mqtt_broker = broker
+                    self.__my_context.variables["broker"] = broker
+                    self.__mqtt_client.connect(broker, **self.__my_context.mqtt_connect_options())
+                else:
+                    self.__my_context.log.debug(f"trying to reconnect to '{broker}', attempt {on_broker}")
+                    self.__mqtt_client.reconnect()
+                self.__mqtt_client.loop_start()
+                # on_connect tells us when the broker has accepted us
+                if self.__connected.wait(self.__my_context.configs["network"]["mqtt"]["keepalive"]):
+                    return
+                self.__my_context.log.debug(f"no answer from '{broker}'")
+                self.__mqtt_client.loop_stop()
+            except OSError as ose:
+                self.__my_context.log.debug(f"error while trying to reconnect - {ose}")
+            except Exception as ex:
+                self.__my_context.log.error(f"reconnect exception {ex}")
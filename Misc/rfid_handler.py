@@ -6,7 +6,7 @@ import binascii
 import json
 import time
 from threading import Thread
-import paho.mqtt.client as mqtt
+from Misc.publisher import Publisher
 
 if context.is_raspberrypi():
     from pn532pi import Pn532, pn532
@@ -38,9 +38,9 @@ class _RFIDException(Exception):
 
 class RfidHandler(Thread):
 
-    def __init__(self, mqtt_client: mqtt.Client, my_context: Context):
+    def __init__(self, publisher: Publisher, my_context: Context):
         self.__my_context: Context = my_context
-        self.__mqtt_client: mqtt.Client = mqtt_client
+        self.__publisher: Publisher = publisher
 
         Thread.__init__(self)
 
@@ -146,10 +146,9 @@ class RfidHandler(Thread):
         self.__report_event(event={"uid": uid_str})
 
     def __report_event(self, event: {}):
-        if not self.__mqtt_client.is_connected():
+        if not self.__publisher.is_connected():
             return
-        self.__mqtt_client.publish(self.__my_context.MQTT_OUTBOUND + MQTT_REPORT_EVENT, json.dumps(event),
-                                   self.__my_context.MQTT_RFID_QOS, False)
+        self.__publisher.publish(MQTT_REPORT_EVENT, event, self.__my_context.MQTT_RFID_QOS)
 
     def __revive_player(self, uid):
         if self.__remaining_revives_per_agent <= 0:
@@ -1,62 +1,152 @@
-import threading, time, json
-import paho.mqtt.client as mqtt
+import threading, time
 import context
 from Misc.audio_player import AudioPlayer
 from context import Context
 from datetime import datetime
 from PagedDisplay import my_lcd
 from PagedDisplay.my_lcd import MyLCD
+from Misc.command_dispatcher import CommandDispatcher
+from Misc.publisher import Publisher
 
 EVERY_MINUTE: int = 60
 MQTT_STATUS: str = "/status"
+MQTT_STATUS_DELTA: str = "/status/delta"
+# secs between two wi-fi checks (and possible deltas)
+CHECK_INTERVAL: float = 5
+# default for status.fields in the config. signal_quality is only reported when it moves to another
+# of the bands the LEDs and the LCD show - and clearly enough so it doesn't flap on the border.
+FIELDS: [str, dict] = {"signal_quality": {"thresholds": [20, 40, 60, 80], "hysteresis": 5}}
 
 
 class StatusJob(threading.Thread):
-    def __init__(self, mqtt_client: mqtt.Client, my_context: Context, audio_player: AudioPlayer, rfid_is_active: bool):
-        self.__rfid_is_active:bool = rfid_is_active
+    """
+    publishes a full (retained) status on connect and as a heartbeat (status.heartbeat secs, 300 by default).
+    in between only the changed fields are sent to /status/delta.
+    numeric fields can be damped in status.fields: {"delta": n} - report changes by at least n.
+    {"thresholds": [..], "hysteresis": n} - report when another band is reached by at least n.
+    """
+
+    def __init__(self, publisher: Publisher, my_context: Context, audio_player: AudioPlayer, rfid_is_active: bool,
+                 command_dispatcher: CommandDispatcher):
+        self.__command_dispatcher = command_dispatcher
+        self.__rfid_is_active: bool = rfid_is_active
         self.__audio_player = audio_player
-        self.__status_counter: int = 0  # so we send a status on the first run
-        self.__bt_wakeup_counter: int = 0
-        # self.__my_lcd = my_lcd
-        self.__mqtt_client = mqtt_client
+        self.__status_counter: int = 0
+        # to calculate the lcd traffic between two status messages
+        self.__lcd_bytes_written: int = 0
+        self.__last_status_at: float = time.monotonic()
+        self.__publisher = publisher
         self.__my_context = my_context
+        config: dict = my_context.configs.get("status", {})
+        self.__heartbeat: float = float(config.get("heartbeat", 300))
+        self.__fields: [str, dict] = {**FIELDS, **config.get("fields", {})}
+        # the fields as the server knows them. None until the first full status has been sent.
+        self.__reported: dict | None = None
+        self.__next_heartbeat: float = 0
+        self.__next_bt_wakeup: float = 0
+        # the full status is only sent by our own thread. other threads just ask for it.
+        self.__requested = threading.Event()
+        self.__wakeup = threading.Event()
         threading.Thread.__init__(self)
         self.start()
 
+    def request_status(self):
+        """
+        called by on_connect and the status command. the full status is sent right away.
+        """
+        self.__requested.set()
+        self.__wakeup.set()
+
     def run(self):
         self.__my_context.log.debug("Status Job starting")
         while True:
+            # a request that comes in from now on ends the next wait
+            self.__wakeup.clear()
             # we update the wi-fi information every 5 seconds
             wifi_info: (int, str, str) = self.__my_context.get_current_wifi_signal_strength()
             self.__my_context.variables["wifi"] = f"{wifi_info[0]}%"
-            self.__my_context.log.trace(f"status_counter, MOD12: {self.__status_counter}, {self.__status_counter % 12}")
-
-            if self.__status_counter % 12 == 0:  # 12 loops with a 5 seconds sleep is a minute
-                self.send_status(wifi_info)
+            now: float = time.monotonic()
+            if self.__requested.is_set() or now >= self.__next_heartbeat or self.__reported is None:
+                self.__requested.clear()
+                self.__send_status(wifi_info)
+            else:
+                self.__send_delta(wifi_info)
+            if now >= self.__next_bt_wakeup:
                 self.__audio_player.bt_wakeup()
-
-            self.__bt_wakeup_counter += 1
+                self.__next_bt_wakeup = now + EVERY_MINUTE
             self.__status_counter += 1
-            time.sleep(5)
+            self.__wakeup.wait(CHECK_INTERVAL)
 
-    def send_status(self, wifi_info: (int, str, str)):
-        if not self.__mqtt_client.is_connected():
-            self.__my_context.log.debug("mqtt client is not connected. skipping status()")
-            return
-        this_status = {
+    def __fields_of(self, wifi_info: (int, str, str)) -> dict:
+        """
+        :return: the fields that are watched for changes
+        """
+        return {
             "version": f"pyAgent {self.__my_context.variables['agversion']}b{self.__my_context.variables['agbuild']}",
             "reconnects": self.__my_context.num_of_reconnects - 1,
             "mqtt-broker": self.__my_context.mqtt_broker,
             "failed_pings": 0,
-            "status_counter": self.__status_counter,
             "ip": self.__my_context.IPADDRESS,
             "ap": wifi_info[2],
             "ssid": wifi_info[1],
             "signal_quality": wifi_info[0],
+            "rfid_is_active": self.__rfid_is_active,
+        }
+
+    def __send_status(self, wifi_info: (int, str, str)):
+        """
+        sends the full status. it is retained, so the server finds it even when it subscribes later.
+        """
+        if not self.__publisher.is_connected():
+            self.__my_context.log.debug("mqtt client is not connected. skipping status()")
+            return
+        now: float = time.monotonic()
+        lcd_bytes_per_sec: float = (self.__my_context.lcd_bytes_written - self.__lcd_bytes_written) / max(
+            now - self.__last_status_at, 1)
+        self.__lcd_bytes_written = self.__my_context.lcd_bytes_written
+        self.__last_status_at = now
+        fields: dict = self.__fields_of(wifi_info)
+        this_status = {
+            **fields,
+            "status_counter": self.__status_counter,
             "timestamp": datetime.now().isoformat(),
-            "rfid_is_active": self.__rfid_is_active
+            "lcd_bytes_per_sec": round(lcd_bytes_per_sec, 1),
+            "reconnect_latency": self.__my_context.reconnect_latency.as_dict(),
+            "time_to_connected": round(self.__my_context.time_to_connected, 2)
+            if self.__my_context.time_to_connected is not None else None,
+            "commands": self.__command_dispatcher.stats(),
+            "command_latency_ms": self.__my_context.command_latency.as_dict()
         }
         self.__my_context.log.debug(f"Sending status #: {self.__status_counter}")
-        # self.__check_signal_strength()
-        self.__mqtt_client.publish(self.__my_context.MQTT_OUTBOUND + MQTT_STATUS, json.dumps(this_status),
-                                   self.__my_context.MQTT_STATUS_QOS, False)
+        self.__publisher.publish(MQTT_STATUS, this_status, self.__my_context.MQTT_STATUS_QOS, retain=True)
+        self.__reported = fields
+        self.__next_heartbeat = now + self.__heartbeat
+
+    def __send_delta(self, wifi_info: (int, str, str)):
+        if not self.__publisher.is_connected():
+            return
+        delta: dict = {key: value for key, value in self.__fields_of(wifi_info).items()
+                       if self.__has_changed(key, self.__reported.get(key), value)}
+        if not delta:
+            return
+        self.__my_context.log.debug(f"Sending status delta: {delta}")
+        self.__reported.update(delta)
+        delta["timestamp"] = datetime.now().isoformat()
+        self.__publisher.publish(MQTT_STATUS_DELTA, delta, self.__my_context.MQTT_STATUS_QOS)
+
+    def __has_changed(self, key: str, reported, value) -> bool:
+        if reported == value:
+            return False
+        field: dict = self.__fields.get(key, {})
+        if not field or not isinstance(value, (int, float)) or not isinstance(reported, (int, float)):
+            return True
+        if "delta" in field and abs(value - reported) < field["delta"]:
+            return False
+        if "thresholds" in field:
+            hysteresis: float = field.get("hysteresis", 0)
+            band: int = sum(1 for threshold in field["thresholds"] if reported >= threshold)
+            # a band is only left when the value is beyond its border by at least the hysteresis
+            upper: int = sum(1 for threshold in field["thresholds"] if value >= threshold + hysteresis)
+            lower: int = sum(1 for threshold in field["thresholds"] if value >= threshold - hysteresis)
+            return upper > band or lower < band
+        return True
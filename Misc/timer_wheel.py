@@ -0,0 +1,149 @@
+import bisect
+import math
+import threading
+import time
+from context import Context, TRACE
+
+
+def format_remaining(secs: int) -> str:
+    """
+    :param secs: remaining seconds
+    :return: mm:ss or hh:mm:ss for an hour and more
+    """
+    hours, rest = divmod(secs, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours:02}:{minutes:02}:{seconds:02}"
+    return f"{minutes:02}:{seconds:02}"
+
+
+class _Subscription:
+    """
+    a listener for one timer key
+    """
+
+    def __init__(self, listener, thresholds: [float] = None):
+        self.listener = listener
+        # ascending ratios of elapsed time (0 = start, 1 = expired). None - every displayed second.
+        self.thresholds: [float] = sorted(thresholds) if thresholds is not None else None
+        # number of thresholds already reported for the current run of the timer
+        self.passed: int = 0
+
+
+class TimerWheel(threading.Thread):
+    """
+    runs the countdown timers on the monotonic clock, independent of the LCD.
+    the thread only wakes up when the displayed second of a timer changes or a timer expires.
+    only then the timer variables are set and the listeners are notified.
+    """
+
+    def __init__(self, my_context: Context):
+        threading.Thread.__init__(self)
+        self.__my_context = my_context
+        self.__log = my_context.get_logger("timers")
+        # key -> (starting value in ms, monotonic deadline in secs)
+        self.__timers: [str, (int, float)] = {}
+        # key -> the seconds currently shown in the variable
+        self.__shown: [str, int] = {}
+        # key -> the listeners for this timer
+        self.__subscriptions: [str, [_Subscription]] = {}
+        self.__condition = threading.Condition()
+        # set when the timers have been changed while the loop was not waiting
+        self.__changed: bool = False
+        self.start()
+
+    def run(self):
+        self.__my_context.log.debug("Timer Wheel starting... ")
+        while True:
+            with self.__condition:
+                self.__changed = False
+                now: float = time.monotonic()
+                updates: [str, str] = {}
+                notifications: [(_Subscription, str, int, float)] = []
+                next_wakeup: float | None = None
+                for key, (initial_value, deadline) in list(self.__timers.items()):
+                    remaining: float = deadline - now
+                    if remaining <= 0:
+                        del self.__timers[key]
+                        self.__shown.pop(key, None)
+                        updates[key] = "--"
+                        notifications += [(sub, key, initial_value, 0) for sub in self.__subscriptions.get(key, [])]
+                        continue
+                    # the display shows 02:00 while there are more than 120 and up to 121 secs left
+                    secs: int = math.ceil(remaining) - 1
+                    second_changed: bool = self.__shown.get(key) != secs
+                    if second_changed:
+                        self.__shown[key] = secs
+                        updates[key] = format_remaining(secs)
+                    # the shown value changes (or the timer expires) when exactly secs are left
+                    wakeup: float = deadline - secs
+                    ratio: float = 1 - remaining * 1000 / initial_value
+                    for sub in self.__subscriptions.get(key, []):
+                        if sub.thresholds is None:
+                            if second_changed:
+                                notifications.append((sub, key, initial_value, remaining * 1000))
+                            continue
+                        passed = bisect.bisect_right(sub.thresholds, ratio)
+                        if passed > sub.passed:
+                            sub.passed = passed
+                            notifications.append((sub, key, initial_value, remaining * 1000))
+                        if passed < len(sub.thresholds):
+                            # the time when the elapsed ratio reaches the next threshold
+                            wakeup = min(wakeup, deadline - initial_value / 1000 * (1 - sub.thresholds[passed]))
+                    next_wakeup = wakeup if next_wakeup is None else min(next_wakeup, wakeup)
+                if updates:
+                    if self.__log.isEnabledFor(TRACE):
+                        self.__log.trace(f"timers changed {updates}")
+                    self.__my_context.variables.update(updates)
+            # the listeners are served outside the lock, so set_timer never waits for them
+            for sub, key, initial_value, remaining in notifications:
+                # this event will be sent out to realize a Progress Bar via the LEDs.
+                sub.listener(key_name=key, old_value=initial_value, new_value=remaining)
+            with self.__condition:
+                if self.__changed:
+                    continue
+                if next_wakeup is None:
+                    self.__condition.wait()
+                else:
+                    self.__condition.wait(max(0.0, next_wakeup - time.monotonic()))
+
+    def set_timer(self, key: str, time_in_secs: int):
+        self.__log.trace(f"setting timer {key} to {time_in_secs}")
+        # we have to add one second here so the display matches what the player expects to see on the display
+        initial_value = (time_in_secs + 1) * 1000
+        with self.__condition:
+            self.__timers[key] = (initial_value, time.monotonic() + initial_value / 1000)
+            self.__shown.pop(key, None)
+            for sub in self.__subscriptions.get(key, []):
+                sub.passed = 0
+            self.__changed = True
+            self.__condition.notify()
+
+    def clear_timers(self):
+        with self.__condition:
+            self.__my_context.variables.update({key: "--" for key in self.__timers.keys()})
+            self.__timers.clear()
+            self.__shown.clear()
+            self.__changed = True
+            self.__condition.notify()
+
+    def subscribe(self, key: str, listener, thresholds: [float] = None):
+        """
+        the listener is called with (key_name, old_value, new_value) - the starting value and the
+        remaining time in ms. new_value is 0 when the timer has expired.
+        :param key: name of the timer
+        :param listener: to be notified
+        :param thresholds: ratios of elapsed time (0 to 1). the listener is only notified when the
+                           timer reaches the next one of them (and on expiry). None - on every displayed second.
+        """
+        with self.__condition:
+            self.__subscriptions.setdefault(key, []).append(_Subscription(listener, thresholds))
+            # a running timer reports the thresholds it has already passed right away
+            self.__changed = True
+            self.__condition.notify()
+
+    def unsubscribe(self, key: str, listener):
+        with self.__condition:
+            self.__subscriptions[key] = [sub for sub in self.__subscriptions.get(key, []) if sub.listener != listener]
+            if not self.__subscriptions[key]:
+                del self.__subscriptions[key]
@@ -0,0 +1,52 @@
+class FrameBuffer:
+    """
+    shadow of the characters the HD44780 is showing right now.
+    compares it with the next frame, so only changed character runs are sent to the display.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        self.__rows: int = rows
+        self.__cols: int = cols
+        # None means unknown content - the next frame is written completely
+        self.__lines: [str | None] = []
+        self.invalidate()
+
+    def invalidate(self):
+        self.__lines = [None] * self.__rows
+
+    def clear(self):
+        """
+        the display has been cleared and shows only blanks now
+        """
+        self.__lines = [" " * self.__cols] * self.__rows
+
+    def diff(self, frame: [str]) -> [(int, int, str)]:
+        """
+        compares the frame with the shadow and takes it as the new content
+        :param frame: one string per row, each exactly cols long
+        :return: list of changed runs (row, col, text). empty when the frame is identical.
+        """
+        runs: [(int, int, str)] = []
+        for row, line in enumerate(frame):
+            shown = self.__lines[row]
+            if shown == line:
+                continue
+            self.__lines[row] = line
+            if shown is None:
+                runs.append((row, 0, line))
+                continue
+            start: int = -1
+            end: int = -1
+            for col in range(self.__cols):
+                if line[col] == shown[col]:
+                    continue
+                # a single unchanged char in between costs as much as a cursor move - so we write it
+                if start >= 0 and col - end > 2:
+                    runs.append((row, start, line[start:end + 1]))
+                    start = -1
+                if start < 0:
+                    start = col
+                end = col
+            if start >= 0:
+                runs.append((row, start, line[start:end + 1]))
+        return runs
@@ -1,3 +1,5 @@
+from PagedDisplay.line_template import LineTemplate
+
 ROWS: int = 4
 
 
@@ -11,13 +13,22 @@ class LCDPage:
     def clear(self):
         self.__lines.clear()
         for row in range(ROWS):
-            self.__lines.append("")
+            self.__lines.append(LineTemplate(""))
 
     def set_line(self, num, text):
-        self.__lines[num] = text
+        self.__lines[num] = LineTemplate(text)
 
     def get_line(self, num):
-        return self.__lines[num]
+        return self.__lines[num].text
+
+    def dependencies(self) -> frozenset[str]:
+        """
+        :return: the variables used on this page
+        """
+        return frozenset(name for line in self.__lines for name in line.dependencies)
+
+    def render_line(self, num, variables) -> str:
+        return self.__lines[num].render(variables)
 
     def get_name(self):
         return self.__name
@@ -0,0 +1,190 @@
+from threading import Thread, Condition
+from PagedDisplay.frame_buffer import FrameBuffer
+from PagedDisplay.virtual_lcd import VirtualCharLCD
+from context import Context, is_raspberrypi, TRACE
+
+if is_raspberrypi():
+    from RPLCD.i2c import CharLCD
+
+# https://rplcd.readthedocs.io/en/stable/usage.html#creating-custom-characters
+LCD_ANTENNA = (
+    0b11111,
+    0b10001,
+    0b01010,
+    0b00100,
+    0b00100,
+    0b00100,
+    0b00100,
+    0b00000
+)
+
+WIFI_POOR = (
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b10000,
+    0b00000
+)
+
+WIFI_FAIR = (
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b01000,
+    0b11000,
+    0b00000
+)
+
+WIFI_GOOD = (
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00100,
+    0b01100,
+    0b11100,
+    0b00000
+)
+
+WIFI_VERY_GOOD = (
+    0b00000,
+    0b00000,
+    0b00000,
+    0b00010,
+    0b00110,
+    0b01110,
+    0b11110,
+    0b00000
+)
+
+WIFI_PERFECT = (
+    0b00000,
+    0b00000,
+    0b00001,
+    0b00011,
+    0b00111,
+    0b01111,
+    0b11111,
+    0b00000
+)
+
+
+class LCDWriter(Thread):
+    """
+    the only thread that talks to the display over I2C.
+    frames are handed over by a single slot mailbox. a new frame replaces the one that hasn't been
+    written yet, so the producers never wait for the bus and bursts end up in one refresh.
+    """
+
+    def __init__(self, my_context: Context, rows: int, cols: int):
+        Thread.__init__(self)
+        self.__my_context = my_context
+        self.__log = my_context.get_logger("lcd")
+        self.__rows: int = rows
+        self.__cols: int = cols
+        self.__use_lcd: bool = False
+        self.__frame_buffer = FrameBuffer(rows, cols)
+        # where the display's cursor is right now. None when unknown.
+        self.__cursor_pos: (int, int) | None = None
+        self.__condition = Condition()
+        # the mailbox - the latest frame that hasn't been written yet
+        self.__frame: [str] | None = None
+        # the display has to be cleared before the next frame
+        self.__clear: bool = False
+        # frames replaced in the mailbox before they could be written
+        self.frames_dropped: int = 0
+
+        if is_raspberrypi():
+            try:
+                self.__char_lcd = CharLCD(self.__my_context.configs["hardware"]["lcd"]["i2c_expander"],
+                                          int(self.__my_context.configs["hardware"]["lcd"]["address"], 16)
+                                          )
+                self.__use_lcd = True
+                self.__init_custom_wifi_chars()
+            except Exception as ex:
+                self.__my_context.log.error(f"LCD display couldn't be initialized: {ex}")
+                self.__use_lcd = False
+
+        if not self.__use_lcd:
+            # headless - the frames end up on a virtual display
+            self.__char_lcd = VirtualCharLCD(rows, cols)
+            self.__init_custom_wifi_chars()
+
+        self.start()
+
+    def is_lcd_is_in_use(self) -> bool:
+        return self.__use_lcd
+
+    @property
+    def virtual_lcd(self) -> VirtualCharLCD | None:
+        """
+        :return: the virtual display when there is no real one. None otherwise.
+        """
+        return None if self.__use_lcd else self.__char_lcd
+
+    def __init_custom_wifi_chars(self):
+        """
+        creating 5 chars to show the wi-fi signal strength in a common fashion
+        creating 1 Antenna Symbol
+        :return:
+        """
+        self.__char_lcd.create_char(0, LCD_ANTENNA)
+        self.__char_lcd.create_char(1, WIFI_POOR)
+        self.__char_lcd.create_char(2, WIFI_FAIR)
+        self.__char_lcd.create_char(3, WIFI_GOOD)
+        self.__char_lcd.create_char(4, WIFI_VERY_GOOD)
+        self.__char_lcd.create_char(5, WIFI_PERFECT)
+
+    def submit(self, frame: [str], clear: bool = False):
+        """
+        hands a frame over to the writer. returns immediately.
+        :param frame: one string per row, each exactly cols long
+        :param clear: clear the display before the frame is written. sticks until a frame has been written.
+        """
+        with self.__condition:
+            if self.__frame is not None:
+                self.frames_dropped += 1
+            self.__frame = frame
+            self.__clear = self.__clear or clear
+            self.__condition.notify()
+
+    def run(self):
+        self.__my_context.log.trace("LCD Writer starting... ")
+        while True:
+            with self.__condition:
+                while self.__frame is None:
+                    self.__condition.wait()
+                frame, clear = self.__frame, self.__clear
+                self.__frame, self.__clear = None, False
+            # the bus is only used outside the lock
+            try:
+                self.__write(frame, clear)
+            except Exception as ex:
+                self.__my_context.log.error(f"error writing to the LCD: {ex}")
+                # we don't know what the display shows now
+                self.__frame_buffer.invalidate()
+                self.__cursor_pos = None
+
+    def __write(self, frame: [str], clear: bool):
+        tracing: bool = self.__log.isEnabledFor(TRACE)
+        if clear:
+            self.__char_lcd.clear()
+            self.__cursor_pos = (0, 0)
+            self.__frame_buffer.clear()
+        # only the changed runs are written - nothing at all when the frame is identical
+        for row, col, text in self.__frame_buffer.diff(frame):
+            if tracing:
+                self.__log.trace(f"writing '{text}' at ({row}, {col})")
+            if self.__cursor_pos != (row, col):
+                self.__char_lcd.cursor_pos = (row, col)
+                self.__my_context.lcd_bytes_written += 1
+            self.__char_lcd.write_string(text)
+            self.__my_context.lcd_bytes_written += len(text)
+            # the display moves on to the next row after the last column
+            col += len(text)
+            self.__cursor_pos = (row, col) if col < self.__cols else ((row + 1) % self.__rows, 0)
@@ -0,0 +1,46 @@
+import re
+
+# ${name} - the placeholders for variables on the LCD
+PLACEHOLDER = re.compile(r"\$\{([^}]*)}")
+
+
+class LineTemplate:
+    """
+    a line of a page, compiled into literal and placeholder segments.
+    the rendered text is cached and only rebuilt when one of the line's own variables has changed.
+    """
+
+    def __init__(self, text: str):
+        self.text: str = text
+        # literals are stored as they are, placeholders by the name of their variable
+        self.__segments: [(bool, str)] = []
+        pos: int = 0
+        for match in PLACEHOLDER.finditer(text):
+            if match.start() > pos:
+                self.__segments.append((False, text[pos:match.start()]))
+            self.__segments.append((True, match.group(1)))
+            pos = match.end()
+        if pos < len(text):
+            self.__segments.append((False, text[pos:]))
+        # the variables this line depends on
+        self.dependencies: tuple[str, ...] = tuple(dict.fromkeys(name for is_var, name in self.__segments if is_var))
+        self.__values: tuple | None = None
+        self.__rendered: str = text
+
+    def render(self, variables: {str: str}) -> str:
+        """
+        :param variables: name -> value
+        :return: the line with its placeholders replaced. unknown variables are left as they are.
+        """
+        if not self.dependencies:
+            return self.text
+        values = tuple(variables.get(name) for name in self.dependencies)
+        if values == self.__values:
+            return self.__rendered
+        self.__values = values
+        current = dict(zip(self.dependencies, values))
+        self.__rendered = "".join(
+            (f"${{{text}}}" if current[text] is None else str(current[text])) if is_var else text
+            for is_var, text in self.__segments
+        )
+        return self.__rendered
@@ -1,136 +1,67 @@
-from threading import Thread, Lock
+from threading import Thread, Condition
 import time
 from collections import OrderedDict
+from contextlib import contextmanager
 from PagedDisplay import lcd_page
-from context import Context, is_raspberrypi
-
-if is_raspberrypi():
-    from RPLCD.i2c import CharLCD
+from PagedDisplay.lcd_writer import LCDWriter
+from context import Context, TRACE
 
 ROWS: int = 4
 COLS: int = 20
-SECONDS_PER_CYCLE: float = 0.5
-CYCLES_PER_PAGE: int = 4
+SECONDS_PER_PAGE: float = 2.0
 
 # todo: perhaps add a "OFFLINE" page that will added to the page cycle when mqtt connection is lost
 # todo: and removed again on reconnect
 
-# https://rplcd.readthedocs.io/en/stable/usage.html#creating-custom-characters
-LCD_ANTENNA = (
-    0b11111,
-    0b10001,
-    0b01010,
-    0b00100,
-    0b00100,
-    0b00100,
-    0b00100,
-    0b00000
-)
-
-WIFI_POOR = (
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b10000,
-    0b00000
-)
-
-WIFI_FAIR = (
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b01000,
-    0b11000,
-    0b00000
-)
-
-WIFI_GOOD = (
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00100,
-    0b01100,
-    0b11100,
-    0b00000
-)
-
-WIFI_VERY_GOOD = (
-    0b00000,
-    0b00000,
-    0b00000,
-    0b00010,
-    0b00110,
-    0b01110,
-    0b11110,
-    0b00000
-)
-
-WIFI_PERFECT = (
-    0b00000,
-    0b00000,
-    0b00001,
-    0b00011,
-    0b00111,
-    0b01111,
-    0b11111,
-    0b00000
-)
-
 
 class MyLCD(Thread):
 
     def __init__(self, my_context: Context):
         Thread.__init__(self)
-        self.__use_lcd: bool = False
         self.__pages = OrderedDict()
         self.__page_index: int = 0
-        self.__last_cycle_started_at: float = 0
-        self.__lock = Lock()
+        # increased with every change of the pages
+        self.__pages_version: int = 0
+        # (version of the page's variables, page index, pages version) of the frame on the display
+        self.__frame_version: tuple | None = None
+        # the variables of the visible page - the only ones we are subscribed to
+        self.__watched: frozenset[str] = frozenset()
+        # guards the pages. the render loop waits on it until something on the display can change.
+        self.__condition = Condition()
+        # the display isn't refreshed while > 0 (see hold)
+        self.__held: int = 0
+        # monotonic time of the next page flip. None when there is only one page.
+        self.__next_flip: float | None = None
+        # the display is cleared with the next frame
+        self.__clear: bool = False
         self.__my_context = my_context
+        self.__log = my_context.get_logger("lcd")
         self.__my_context.set_wifi_vars(signal_quality=0)
-
-        if is_raspberrypi():
-            try:
-                self.__char_lcd = CharLCD(self.__my_context.configs["hardware"]["lcd"]["i2c_expander"],
-                                          int(self.__my_context.configs["hardware"]["lcd"]["address"], 16)
-                                          )
-                self.__use_lcd = True
-                self.__init_custom_wifi_chars()
-            except Exception as ex:
-                self.__my_context.log.error(f"LCD display couldn't be initialized: {ex}")
-                self.__use_lcd = False
+        # owns the display. we never wait for the I2C bus here.
+        self.__writer = LCDWriter(my_context, ROWS, COLS)
 
         self.__init_class()
         self.start()
 
     def is_lcd_is_in_use(self) -> bool:
-        return self.__use_lcd
+        return self.__writer.is_lcd_is_in_use()
 
-    def __init_custom_wifi_chars(self):
+    @property
+    def virtual_lcd(self):
         """
-        creating 5 chars to show the wi-fi signal strength in a common fashion
-        creating 1 Antenna Symbol
-        :return:
+        :return: the VirtualCharLCD when running without a display. None otherwise.
         """
-        self.__char_lcd.create_char(0, LCD_ANTENNA)
-        self.__char_lcd.create_char(1, WIFI_POOR)
-        self.__char_lcd.create_char(2, WIFI_FAIR)
-        self.__char_lcd.create_char(3, WIFI_GOOD)
-        self.__char_lcd.create_char(4, WIFI_VERY_GOOD)
-        self.__char_lcd.create_char(5, WIFI_PERFECT)
+        return self.__writer.virtual_lcd
+
+    def __on_variables_changed(self, keys: set[str]):
+        with self.__condition:
+            self.__condition.notify()
 
     def __init_class(self):
-        self.__loop_counter = 0
         self.__pages.clear()
         self.__page_index = 0
-        if self.__use_lcd:
-            self.__char_lcd.clear()
+        self.__next_flip = None
+        self.__clear = True
         self.__pages["page0"] = lcd_page.LCDPage("page0")
         self.__my_context.variables["ssid"] = "--"
         self.__set_line("page0", 1, "pyAgent ${agversion}b${agbuild}")
@@ -140,20 +71,40 @@ class MyLCD(Thread):
 
     def run(self):
         self.__my_context.log.trace("LCD Loop starting... ")
-        while True:
-            self.__lock.acquire()
-            now: float = time.time_ns() / 1000000
-            self.__my_context.calculate_timers(self.__last_cycle_started_at, now)
-            self.__last_cycle_started_at = now
-            if self.__loop_counter % CYCLES_PER_PAGE == 0:
-                self.__next_page()  # if necessary
-            self.__display_active_page()
-            self.__lock.release()
-            time.sleep(SECONDS_PER_CYCLE)
-            self.__loop_counter += 1
+        with self.__condition:
+            while True:
+                now: float = time.monotonic()
+                if len(self.__pages) == 1:
+                    self.__next_flip = None
+                elif self.__next_flip is None:
+                    self.__next_flip = now + SECONDS_PER_PAGE
+                elif now >= self.__next_flip:
+                    self.__next_page()
+                    self.__next_flip += SECONDS_PER_PAGE
+                    # keep the pace, unless we are far behind
+                    if self.__next_flip <= now:
+                        self.__next_flip = now + SECONDS_PER_PAGE
+                if not self.__held:
+                    self.__display_active_page()
+                # woken up by changes of the pages or the variables. nothing else can change the display.
+                self.__condition.wait(None if self.__next_flip is None else self.__next_flip - now)
+
+    @contextmanager
+    def hold(self):
+        """
+        the display isn't refreshed until the block is left. so several changes show up at once.
+        """
+        with self.__condition:
+            self.__held += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__held -= 1
+                self.__condition.notify()
 
     def proc_paged(self, json):
-        self.__lock.acquire()
+        self.__condition.acquire()
         try:
             self.__init_class()
             for page, lines in json.items():
@@ -165,7 +116,52 @@ class MyLCD(Thread):
         except Exception as ex:
             self.__my_context.log.error(f"error parsing scheme: {ex}")
         finally:
-            self.__lock.release()
+            self.__condition.notify()
+            self.__condition.release()
+
+    def proc_patch(self, json):
+        """
+        changes single pages and lines in place. the display is not cleared, the page rotation goes on
+        where it is and only the changed characters are sent to the display.
+        {
+            "page1": {"2": "line 2 only", "4": "and line 4"},  - sets single lines (1-4). adds the page if necessary.
+            "page2": ["line 1", "line 2"],                     - sets all lines. missing lines are blank.
+            "page3": null                                      - removes the page
+        }
+        """
+        self.__condition.acquire()
+        try:
+            for page, lines in json.items():
+                self.__my_context.log.debug(f"paged_patch: {page}, {lines}")
+                if lines is None:
+                    self.__remove_page(page)
+                elif isinstance(lines, dict):
+                    for num, line in lines.items():
+                        self.__set_line(page, int(num), line)
+                else:
+                    for num in range(1, ROWS + 1):
+                        self.__set_line(page, num, lines[num - 1] if num <= len(lines) else "")
+        except Exception as ex:
+            self.__my_context.log.error(f"error parsing patch: {ex}")
+        finally:
+            self.__condition.notify()
+            self.__condition.release()
+
+    def __remove_page(self, key: str):
+        if key not in self.__pages:
+            return
+        if len(self.__pages) == 1:
+            self.__my_context.log.warning(f"can't remove {key} - it is the last page")
+            return
+        self.__my_context.log.debug(f"removing page {key}")
+        index: int = list(self.__pages.keys()).index(key)
+        del self.__pages[key]
+        self.__pages_version += 1
+        # the active page stays on the display. when it was removed, the next one moves up.
+        if index < self.__page_index:
+            self.__page_index -= 1
+        elif self.__page_index >= len(self.__pages):
+            self.__page_index = 0
 
     def __add_page(self, key: str):
         if key in self.__pages:
@@ -174,31 +170,53 @@ class MyLCD(Thread):
         self.__pages[key] = lcd_page.LCDPage(key)
 
     def __set_line(self, key: str, line: int, text: str):
+        self.__pages_version += 1
         self.__add_page(key)
         if line < 1 or line > ROWS:
             return
         self.__pages[key].set_line(line - 1, text)
 
     def __next_page(self):
-        self.__my_context.log.trace(f"pages size {len(self.__pages)}")
+        if self.__log.isEnabledFor(TRACE):
+            self.__log.trace(f"pages size {len(self.__pages)}")
         if len(self.__pages) == 1:
             return
         self.__page_index += 1
         if self.__page_index >= len(self.__pages):
             self.__page_index = 0
-        self.__my_context.log.trace(f"index of active_page {self.__page_index}")
+        if self.__log.isEnabledFor(TRACE):
+            self.__log.trace(f"index of active_page {self.__page_index}")
+
+    def __watch(self, keys: frozenset[str]):
+        """
+        only changes of these variables wake up the render loop
+        """
+        if keys == self.__watched:
+            return
+        if self.__watched:
+            self.__my_context.variables.unsubscribe(self.__on_variables_changed)
+        # timers change their variables exactly on the second - so we render right then
+        if keys:
+            self.__my_context.variables.subscribe(self.__on_variables_changed, keys)
+        self.__watched = keys
 
     def __display_active_page(self):
         active_page_key: str = list(self.__pages.keys())[self.__page_index]
+        # subscribed before rendering, so no change after the rendering gets lost
+        self.__watch(self.__pages[active_page_key].dependencies())
+        variables = self.__my_context.variables
+        # nothing to do when neither the page's variables nor the visible page have changed
+        frame_version = (max((variables.key_version(key) for key in self.__watched), default=0),
+                         self.__page_index, self.__pages_version)
+        if frame_version == self.__frame_version:
+            return
+        self.__frame_version = frame_version
+        tracing: bool = self.__log.isEnabledFor(TRACE)
+        frame: [str] = []
         for row in range(ROWS):
-            line = self.__pages[active_page_key].get_line(row)
-            if line:
-                line = self.__my_context.replace_variables(line)[:COLS]
-            line = line.ljust(COLS, " ")
-            if self.__use_lcd:
-                self.__char_lcd.cursor_pos = (row, 0)
-                self.__char_lcd.write_string(line)
-            # write to some device
-            # prevent unnecessary refreshes
-            #
-            self.__my_context.log.trace(f"VISIBLE PAGE #{self.__page_index} Line {row}: '{line}'")
+            line = self.__pages[active_page_key].render_line(row, self.__my_context.variables)[:COLS]
+            frame.append(line.ljust(COLS, " "))
+            if tracing:
+                self.__log.trace(f"VISIBLE PAGE #{self.__page_index} Line {row}: '{frame[row]}'")
+        self.__writer.submit(frame, self.__clear)
+        self.__clear = False
@@ -0,0 +1,103 @@
+from threading import Lock
+
+# the PCF8574 drives the HD44780 in 4-bit mode. every nibble takes 3 writes on the I2C bus
+# (data, data with enable, data without enable) - so 6 writes for every command or data byte.
+I2C_WRITES_PER_BYTE: int = 6
+
+
+class VirtualCharLCD:
+    """
+    headless stand-in for RPLCD.i2c.CharLCD. it keeps the characters of the display in a matrix
+    and counts the transactions the real display would have needed on the I2C bus.
+    only the parts of the CharLCD api we are using are supported.
+    """
+
+    def __init__(self, rows: int = 4, cols: int = 20):
+        self.__lock = Lock()
+        self.rows: int = rows
+        self.cols: int = cols
+        self.__matrix: [[str]] = []
+        self.__cursor_pos: (int, int) = (0, 0)
+        # location (0-7) -> bitmap of the user defined chars
+        self.custom_chars: [int, tuple] = {}
+        # instructions sent to the controller (clear, home, set address)
+        self.commands: int = 0
+        # bytes written to the display or character memory
+        self.data_bytes: int = 0
+        self.clear()
+        self.commands = 0
+
+    @property
+    def i2c_writes(self) -> int:
+        """
+        :return: number of writes the real display would have needed on the I2C bus
+        """
+        return (self.commands + self.data_bytes) * I2C_WRITES_PER_BYTE
+
+    @property
+    def cursor_pos(self) -> (int, int):
+        return self.__cursor_pos
+
+    @cursor_pos.setter
+    def cursor_pos(self, value: (int, int)):
+        row, col = value
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError(f"cursor position {value} is outside of the display")
+        with self.__lock:
+            self.__cursor_pos = (row, col)
+            self.commands += 1
+
+    def write_string(self, value: str):
+        """
+        writes the text at the cursor. like the CharLCD (with auto_linebreaks) the cursor moves
+        on to the next row after the last column. \\r and \\n are not supported.
+        """
+        with self.__lock:
+            row, col = self.__cursor_pos
+            for char in value:
+                self.__matrix[row][col] = char
+                self.data_bytes += 1
+                col += 1
+                if col == self.cols:
+                    row, col = (row + 1) % self.rows, 0
+                    # the CharLCD sets the new address by itself
+                    self.commands += 1
+            self.__cursor_pos = (row, col)
+
+    def clear(self):
+        with self.__lock:
+            self.__matrix = [[" "] * self.cols for row in range(self.rows)]
+            self.__cursor_pos = (0, 0)
+            self.commands += 1
+
+    def home(self):
+        with self.__lock:
+            self.__cursor_pos = (0, 0)
+            self.commands += 1
+
+    def create_char(self, location: int, bitmap: tuple):
+        if not 0 <= location <= 7:
+            raise ValueError(f"location {location} must be between 0 and 7")
+        if len(bitmap) != 8:
+            raise ValueError("bitmap must have 8 rows")
+        with self.__lock:
+            self.custom_chars[location] = tuple(bitmap)
+            # set the character memory address, 8 rows of data, back to the display memory
+            self.commands += 2
+            self.data_bytes += len(bitmap)
+
+    def close(self, clear: bool = False):
+        if clear:
+            self.clear()
+
+    def reset_counters(self):
+        with self.__lock:
+            self.commands = 0
+            self.data_bytes = 0
+
+    def snapshot(self) -> [str]:
+        """
+        :return: the content of the display - one string per row. user defined chars are \\x00 to \\x07.
+        """
+        with self.__lock:
+            return ["".join(row) for row in self.__matrix]
@@ -1,5 +1,5 @@
 from context import is_raspberrypi, Context
-from gpiozero import Device, LED
+from gpiozero import Device, LED, Pin
 
 if is_raspberrypi():
     from gpiozero.pins.pigpio import PiGPIOFactory
@@ -9,25 +9,26 @@ else:
 
 class MyPin:
     def __init__(self, name: str, my_context: Context):
-        if is_raspberrypi():
-            Device.pin_factory = PiGPIOFactory()
-        else:
-            Device.pin_factory = MockFactory()
+        # all pins share one factory - the PinBank writes them through the same connection
+        if Device.pin_factory is None:
+            if is_raspberrypi():
+                Device.pin_factory = PiGPIOFactory()
+            else:
+                Device.pin_factory = MockFactory()
         self.name: str = name
         self.__my_context = my_context
-        self.__INVERTED_TRIGGER = self.name in self.__my_context.LOW_TRIGGER
-        self.__prev_value = -1
+        self.INVERTED_TRIGGER: bool = self.name in self.__my_context.LOW_TRIGGER
         gpio: str = self.__my_context.configs["hardware"][self.name]
         self.__my_context.log.trace(f"trying {name} at hw pin {gpio}")
         # pin numbering see: https://gpiozero.readthedocs.io/en/stable/recipes.html#pin-numbering
         self.__pin: LED = LED(gpio)
         self.__pin.value = self.__correct_value(0)
+        # Broadcom number of the pin (GPIO17 -> 17). Needed for bank writes.
+        self.number: int = int(self.__pin.pin.info.name[4:])
 
-    def set_value(self, value: int):
-        self.__pin.value = self.__correct_value(value)
-        if value != self.__prev_value:
-            self.__prev_value = value
-            self.__my_context.log.trace(f"pin_state '{self.name}' is {self.__pin.value}")
+    @property
+    def pin(self) -> Pin:
+        return self.__pin.pin
 
     def __str__(self) -> str:
         return f"{self.name}: {self.__correct_value(self.__pin.value)}"
@@ -38,4 +39,4 @@ class MyPin:
         :param value: the wanted value in the default notion of (1 is on, 0 is off)
         :return: corrected value if this pin is in the inversion list (config.json)
         """
-        return 1 - value if self.__INVERTED_TRIGGER else value
+        return 1 - value if self.INVERTED_TRIGGER else value
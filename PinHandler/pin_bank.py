@@ -0,0 +1,108 @@
+from PinHandler.my_pin import MyPin
+from context import Context, is_raspberrypi, TRACE
+
+
+class PinBank:
+    """
+    collects the wanted levels of all pins during a tick and writes only the changed ones.
+    on the Pi this is one set and one clear bank operation via pigpio. off-Pi the same masks
+    are applied to the mock pins.
+    """
+
+    def __init__(self, my_context: Context):
+        self.__my_context = my_context
+        self.__log = my_context.get_logger("pins")
+        self.__pins: [str, MyPin] = {}
+        # levels (1 is on, 0 is off) staged during the current tick
+        self.__staged: [str, int] = {}
+        # levels as they are on the pins right now. None when unknown.
+        self.__written: [str, int | None] = {}
+        # pins that are driven by someone else (e.g. the WaveBackend)
+        self.__detached: set[str] = set()
+        # pigpio connection on the Pi, None for the mock factory
+        self.__connection = None
+        # number of bank writes and of changed pins since the start - for statistics
+        self.writes: int = 0
+        self.edges: int = 0
+
+    def add(self, name: str) -> MyPin:
+        my_pin = MyPin(name, self.__my_context)
+        if self.__connection is None and is_raspberrypi():
+            self.__connection = my_pin.pin.factory.connection
+        self.__pins[name] = my_pin
+        self.__written[name] = 0  # MyPin starts switched off
+        return my_pin
+
+    def get(self, name: str) -> MyPin:
+        return self.__pins[name]
+
+    @property
+    def connection(self):
+        """
+        :return: the pigpio connection or None when running on the mock factory
+        """
+        return self.__connection
+
+    def detach(self, name: str):
+        """
+        the bank won't write this pin anymore until it is attached again
+        """
+        self.__detached.add(name)
+        self.__staged.pop(name, None)
+
+    def attach(self, name: str):
+        """
+        gives the pin back to the bank. the next staged level is written in any case,
+        as we don't know what the pin is showing right now.
+        """
+        self.__detached.discard(name)
+        self.__written[name] = None
+
+    def stage(self, name: str, value: int):
+        """
+        :param name: of the pin
+        :param value: the wanted value in the default notion of (1 is on, 0 is off)
+        """
+        if name in self.__detached:
+            return
+        self.__staged[name] = value
+
+    def commit(self):
+        """
+        writes all staged levels that differ from the current pin states
+        """
+        set_mask: int = 0
+        clear_mask: int = 0
+        tracing: bool = self.__log.isEnabledFor(TRACE)
+        for name, value in self.__staged.items():
+            if self.__written[name] == value:
+                continue
+            self.__written[name] = value
+            self.edges += 1
+            my_pin = self.__pins[name]
+            if tracing:
+                self.__log.trace(f"pin_state '{name}' is {value}")
+            # inverted pins are necessary for sirens
+            level = 1 - value if my_pin.INVERTED_TRIGGER else value
+            if level:
+                set_mask |= 1 << my_pin.number
+            else:
+                clear_mask |= 1 << my_pin.number
+        self.__staged.clear()
+        if set_mask or clear_mask:
+            self.__write(set_mask, clear_mask)
+            self.writes += 1
+
+    def __write(self, set_mask: int, clear_mask: int):
+        if self.__connection:
+            if set_mask:
+                self.__connection.set_bank_1(set_mask)
+            if clear_mask:
+                self.__connection.clear_bank_1(clear_mask)
+            return
+        # mock factory - same masks, applied pin by pin
+        for my_pin in self.__pins.values():
+            if set_mask >> my_pin.number & 1:
+                my_pin.pin.state = 1
+            elif clear_mask >> my_pin.number & 1:
+                my_pin.pin.state = 0
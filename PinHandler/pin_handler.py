@@ -1,38 +1,54 @@
+import heapq
+import itertools
 import threading
-import sys
 import time
 import json
-from pathlib import PurePath, Path
-from PinHandler.my_pin import MyPin
+from PinHandler.pin_bank import PinBank
 from PinHandler.pin_scheme import PinScheme
+from PinHandler.scheme_table import Scheme, SchemeTable, compile_scheme
+from PinHandler.wave_backend import WaveBackend
 from context import Context
-from os import path
 
-PERIOD = 25  # ms
-SLEEP = PERIOD / 1000
 ALL_SIRENS = ["sir1", "sir2", "sir3", "sir4", "buzzer"]
 ALL_LEDS = ["wht", "red", "ylw", "grn", "blu"]
 
 
+class TickStats:
+    """
+    collected by the pin loop while it is set as PinHandler.tick_stats. used by the benchmarks.
+    """
+
+    def __init__(self):
+        # secs spent in each tick
+        self.durations: [float] = []
+        # secs between a transition's deadline and the tick that executed it
+        self.lateness: [float] = []
+
+
 class PinHandler(threading.Thread):
     def __init__(self, my_context: Context):
-        self.SCHEME_MACROS: json = None
-        self.__lock = threading.Lock()
-        self.__pin_registry: [str, MyPin] = {}
+        # pin name -> the group that currently drives the pin (None when idle)
+        self.__pin_registry: [str, PinScheme | None] = {}
+        # heap of (deadline, sequence, group) - the next transitions on the monotonic clock
+        self.__deadlines: list[tuple[float, int, PinScheme]] = []
+        # tie-breaker for groups with the same deadline
+        self.__sequence = itertools.count()
+        # the currently valid deadline per group. heap entries that don't match are outdated.
+        self.__due: [PinScheme, float] = {}
+        # compiled commands waiting for the next tick - pin name -> scheme (None means off).
+        # a newer command for the same pin replaces the older one.
+        self.__pending: [str, Scheme | None] = {}
+        # only held to hand over the pending commands - never during GPIO work
+        self.__pending_lock = threading.Lock()
+        # wakes up the loop when new commands arrive
+        self.__wakeup = threading.Event()
+        # statistics are only collected when this is set
+        self.tick_stats: TickStats | None = None
         threading.Thread.__init__(self)
         self.__my_context = my_context
 
-        macros: str = path.abspath(path.join(path.dirname(__file__), "scheme_macros.json"))
-        with open(macros) as my_macros:
-            self.SCHEME_MACROS = json.loads(my_macros.read())
-
-        # macros: Path
-        # if Path("/opt/pyAgent/scheme_macros.json").exists():
-        #     macros = Path("/opt/pyAgent/scheme_macros.json")
-        # else:
-        #     macros = Path(self.__my_context.WORKSPACE, "scheme_macros.json")
-        # with open(macros) as my_file:
-        #     self.SCHEME_MACROS = json.loads(my_file.read())
+        self.__scheme_table = SchemeTable(self.__my_context)
+        self.__pin_bank = PinBank(self.__my_context)
 
         self.__add("wht")
         self.__add("red")
@@ -44,70 +60,154 @@ class PinHandler(threading.Thread):
         self.__add("sir2")
         self.__add("sir3")
         self.__add("sir4")
+        # optional - endless schemes are driven by DMA waveforms then
+        self.__wave_backend: WaveBackend | None = None
+        if self.__my_context.configs["hardware"].get("dma_waves", False):
+            self.__wave_backend = WaveBackend(self.__pin_bank, self.__my_context)
         self.start()
 
     def run(self):
         self.__my_context.log.debug("PinHandler Loop starting... ")
         while True:
-            self.__lock.acquire()
-            for key, my_pin_scheme in self.__pin_registry.items():
-                my_pin_scheme.next()
-            self.__lock.release()
-            time.sleep(SLEEP)
+            now: float = time.monotonic()
+            tick_stats = self.tick_stats
+            self.__apply_pending(now)
+            while self.__deadlines and self.__deadlines[0][0] <= now:
+                deadline, _, group = heapq.heappop(self.__deadlines)
+                if self.__due.get(group) != deadline:
+                    continue  # outdated by a newer scheme or an off
+                if tick_stats:
+                    tick_stats.lateness.append(now - deadline)
+                self.__schedule(group, group.next(now))
+            # all transitions of this tick are written at once
+            if self.__wave_backend:
+                self.__run_in_software(self.__wave_backend.update())
+            self.__pin_bank.commit()
+            if tick_stats:
+                tick_stats.durations.append(time.monotonic() - now)
+            # sleeps until the next transition or until proc_pins brings something new
+            # no timeout when all pins are idle
+            self.__wakeup.wait(self.__deadlines[0][0] - time.monotonic() if self.__deadlines else None)
+            self.__wakeup.clear()
+
+    @property
+    def pin_bank(self) -> PinBank:
+        return self.__pin_bank
+
+    def __apply_pending(self, now: float):
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, {}
+        # pins with the same scheme in one tick form a group and share the scheme clock
+        groups: [Scheme | None, [str]] = {}
+        for key, scheme in pending.items():
+            self.__leave_group(key)
+            if self.__wave_backend:
+                if scheme and self.__wave_backend.assign(key, scheme):
+                    continue
+                self.__wave_backend.release(key)
+            groups.setdefault(scheme, []).append(key)
+        for scheme, members in groups.items():
+            if scheme is None:
+                for key in members:
+                    self.__pin_bank.stage(key, 0)
+                continue
+            group = PinScheme(scheme, members, self.__pin_bank, self.__my_context)
+            for key in members:
+                self.__pin_registry[key] = group
+            self.__schedule(group, group.start(now))
+
+    def __leave_group(self, key: str):
+        group = self.__pin_registry[key]
+        if not group:
+            return
+        self.__pin_registry[key] = None
+        group.remove(key)
+        if not group.members:
+            self.__schedule(group, None)
+
+    def __schedule(self, group: PinScheme, deadline: float | None):
+        if deadline is None:
+            self.__due.pop(group, None)
+            for key in group.members:
+                self.__pin_registry[key] = None
+            return
+        self.__due[group] = deadline
+        heapq.heappush(self.__deadlines, (deadline, next(self.__sequence), group))
+
+    def __run_in_software(self, schemes: [str, Scheme]):
+        """
+        starts the pins again that the wave backend has given back - unless there are newer commands for them
+        """
+        if not schemes:
+            return
+        with self.__pending_lock:
+            for key, scheme in schemes.items():
+                self.__pending.setdefault(key, scheme)
+        self.__wakeup.set()
+
+    def __enqueue(self, commands: [str, Scheme | None]):
+        if not commands:
+            return
+        with self.__pending_lock:
+            self.__pending.update(commands)
+        self.__wakeup.set()
 
     def __add(self, mypin_name: str):
         self.__my_context.log.debug(f"adding pin {mypin_name}")
-        self.__pin_registry[mypin_name] = PinScheme(mypin_name, self.__my_context)
+        self.__pin_bank.add(mypin_name)
+        self.__pin_registry[mypin_name] = None
 
     def leds_off(self):
-        for pin in ALL_LEDS:
-            self.off(pin)
+        self.__enqueue({pin: None for pin in ALL_LEDS})
 
     def sirens_off(self):
-        for pin in ALL_SIRENS:
-            self.off(pin)
+        self.__enqueue({pin: None for pin in ALL_SIRENS})
 
     def off(self, pin):
-        self.__pin_registry[pin].clear()
+        self.__enqueue({pin: None})
 
     def proc_pins(self, incoming: json):
-        self.__lock.acquire()
+        """
+        compiles the incoming schemes and hands them over to the pin loop.
+        never waits for the loop, so this is safe to call from the mqtt thread.
+        """
+        commands: [str, Scheme | None] = {}
         try:
             self.__my_context.log.debug(f"incoming json{json.dumps(incoming)}")
             # Preprocess sir_all and led_all device selectors
-            # off is processed first, and then removed from the message
-            # other schemes are duplicated to their devices names.
-            if "sir_all" in incoming:
-                if str(incoming["sir_all"]).lower() == "off":
-                    for pin in ALL_SIRENS:
-                        self.off(pin)
-                else:
-                    for pin in ALL_SIRENS:
-                        incoming[pin] = incoming["sir_all"]
-                del incoming["sir_all"]
-            #
-            if "led_all" in incoming:
-                if str(incoming["led_all"]).lower() == "off":
-                    for pin in ALL_LEDS:
-                        self.off(pin)
-                else:
-                    for pin in ALL_LEDS:
-                        incoming[pin] = incoming["led_all"]
-                del incoming["led_all"]
+            # off is processed first, and then removed from the message - single pins can still be switched on.
+            # other schemes are compiled once and shared by their devices. they win over single pins.
+            selected: [str, Scheme] = {}
+            for selector, pins in [("sir_all", ALL_SIRENS), ("led_all", ALL_LEDS)]:
+                if selector not in incoming:
+                    continue
+                scheme = None if str(incoming[selector]).lower() == "off" else self.__compile(incoming[selector])
+                for pin in pins:
+                    if scheme is None:
+                        commands[pin] = None
+                    else:
+                        selected[pin] = scheme
+                del incoming[selector]
             #
             for key, value in incoming.items():
                 self.__my_context.log.debug(f"found key: {key}")
-                if str(value).lower() == "off":
-                    self.off(key)
-                    continue
-                if str(value).lower() in self.SCHEME_MACROS:
-                    json_scheme = self.SCHEME_MACROS[value]
-                else:
-                    json_scheme = value
-
-                repeat = sys.maxsize if json_scheme["repeat"] < 0 else json_scheme["repeat"] - 1
-                self.__pin_registry[key].init(repeat, json_scheme["scheme"])
+                if key not in self.__pin_registry:
+                    raise KeyError(f"unknown pin '{key}'")
+                commands[key] = None if str(value).lower() == "off" else self.__compile(value)
+            commands.update(selected)
         except Exception as ex:
             self.__my_context.log.error(f"error parsing scheme: {ex}")
         finally:
-            self.__lock.release()
+            self.__enqueue(commands)
+
+    def __compile(self, value) -> Scheme:
+        """
+        :param value: either the name of a macro or a scheme in json notation
+        :return: the shared macro or a newly compiled scheme
+        """
+        if isinstance(value, str):
+            scheme = self.__scheme_table.get(value.lower())
+            if scheme is None:
+                raise ValueError(f"unknown scheme macro '{value}'")
+            return scheme
+        return compile_scheme(value)
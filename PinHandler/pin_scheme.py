@@ -1,48 +1,81 @@
-from PinHandler import pin_handler
-from PinHandler.my_pin import MyPin
-from context import Context
+from PinHandler.pin_bank import PinBank
+from PinHandler.scheme_table import Scheme
+from context import Context, TRACE
 
 
 class PinScheme:
+    """
+    runs a compiled scheme on a group of pins. all members share one scheme clock,
+    so they switch on the same tick and stay in phase.
+    """
 
-    def __init__(self, mypin_name: str, my_context: Context):
-        self.__scheme: list[int] = []
-        self.__pointer: int = 0
-        self.__repeat: int = 0
-        self.__my_pin: MyPin
+    def __init__(self, scheme: Scheme, members: [str], pin_bank: PinBank, my_context: Context):
+        # the segments of the scheme - pairs of (level, duration in ms). shared, not copied.
+        self.__segments: tuple[tuple[int, int], ...] = scheme.segments
+        self.__repeat: int = scheme.repeat
+        self.__index: int = 0
+        # monotonic time (in secs) when the current segment ends
+        self.__deadline: float = 0
+        self.members: [str] = list(members)
+        self.__pin_bank: PinBank = pin_bank
         self.__my_context: Context = my_context
-        self.__my_pin = MyPin(mypin_name, self.__my_context)
+        self.__log = my_context.get_logger("pins")
+
+    def start(self, now: float) -> float | None:
+        """
+        starts the scheme on all members
+        :param now: monotonic time in secs when the scheme starts
+        :return: the time of the next transition or None if there is nothing to do
+        """
+        if not self.__segments:
+            self.clear()
+            return None
+        self.__index = 0
+        self.__deadline = now + self.__segments[0][1] / 1000
+        self.__set_members(self.__segments[0][0])
+        return self.__deadline
+
+    def remove(self, name: str):
+        """
+        the pin leaves the group without being touched. it is about to get a new scheme.
+        """
+        self.members.remove(name)
 
     def clear(self):
-        self.__my_context.log.trace(f"clearing scheme for pin '{self.__my_pin.name}'")
-        self.__scheme.clear()
-        self.__repeat = 0
-        self.__pointer = 0
-        self.__my_pin.set_value(0)
-
-    def init(self, repeat, json_scheme):
-        self.clear()
-        self.__repeat = repeat
-        for value in json_scheme:
-            multiplier = abs(int(value) // pin_handler.PERIOD)
-            sign = 1 if value >= 0 else -1
-            #
-            for i in range(multiplier):
-                self.__scheme.append(pin_handler.PERIOD * sign)
-
-    def next(self):
-        if not self.__scheme:
-            return
+        if self.__log.isEnabledFor(TRACE):
+            self.__log.trace(f"clearing scheme for pins {self.members}")
+        self.__set_members(0)
+        self.__segments = ()
+
+    def next(self, now: float) -> float | None:
+        """
+        advances the scheme to the given time and sets the pins accordingly
+        :param now: monotonic time in secs
+        :return: the time of the next transition or None when the scheme has ended
+        """
+        if not self.__segments or not self.members:
+            return None
+        # deadlines are added up from the start of the scheme, so late wake-ups don't accumulate
+        while self.__deadline <= now:
+            self.__index += 1
+            if self.__index >= len(self.__segments):
+                self.__index = 0
+                if self.__repeat:
+                    if self.__log.isEnabledFor(TRACE):
+                        self.__log.trace(f"reached end of scheme list - repeat #{self.__repeat} ")
+                    self.__repeat -= 1
+                else:
+                    self.__log.trace("reached end of scheme list - no more repeats - done")
+                    self.clear()
+                    return None
+            self.__deadline += self.__segments[self.__index][1] / 1000
         #
-        self.__my_context.log.trace(
-            f"{self.__my_pin.name}: pointer: {self.__pointer} = {self.__scheme[self.__pointer]}")
-        self.__my_pin.set_value(1 if self.__scheme[self.__pointer] >= 0 else 0)
-        self.__pointer += 1
-        if self.__pointer >= len(self.__scheme):
-            self.__pointer = 0
-            if self.__repeat:
-                self.__my_context.log.trace(f"reached end of scheme list - repeat #{self.__repeat} ")
-                self.__repeat -= 1
-            else:
-                self.__my_context.log.trace(f"reached end of scheme list - no more repeats - done")
-                self.clear()
+        level, duration = self.__segments[self.__index]
+        if self.__log.isEnabledFor(TRACE):
+            self.__log.trace(f"{self.members}: segment: {self.__index} = {level} for {duration} ms")
+        self.__set_members(level)
+        return self.__deadline
+
+    def __set_members(self, level: int):
+        for name in self.members:
+            self.__pin_bank.stage(name, level)
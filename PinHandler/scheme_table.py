@@ -0,0 +1,101 @@
+import json
+import sys
+import threading
+import time
+from os import path
+from pathlib import Path
+from typing import NamedTuple
+from context import Context
+
+MACRO_FILE: str = "scheme_macros.json"
+# how often (in secs) the macro files are checked for changes
+RELOAD_CHECK_INTERVAL: float = 1
+
+
+class Scheme(NamedTuple):
+    """
+    a compiled pin scheme. it is immutable, so all pins running the same scheme share one instance.
+    """
+    # number of repetitions after the first run. sys.maxsize for endless schemes
+    repeat: int
+    # run-length encoded - pairs of (level, duration in ms)
+    segments: tuple[tuple[int, int], ...]
+
+
+def compile_scheme(json_scheme: json) -> Scheme:
+    """
+    compiles a scheme in its json notation
+    :param json_scheme: e.g. {"repeat": -1, "scheme": [1000, -1000]}
+    :return: the compiled scheme
+    """
+    repeat = sys.maxsize if json_scheme["repeat"] < 0 else json_scheme["repeat"] - 1
+    segments: list[tuple[int, int]] = []
+    for value in json_scheme["scheme"]:
+        level = 1 if value >= 0 else 0
+        duration = abs(int(value))
+        if not duration:
+            continue
+        # adjacent values with the same level are merged into one segment
+        if segments and segments[-1][0] == level:
+            segments[-1] = (level, segments[-1][1] + duration)
+        else:
+            segments.append((level, duration))
+    return Scheme(repeat, tuple(segments))
+
+
+class SchemeTable:
+    """
+    the compiled scheme macros. the built-in macros can be extended or overridden by a
+    scheme_macros.json in the workspace. both files are reloaded when they change.
+    get() is called from several threads (command workers, timer callbacks, the reconnect supervisor).
+    """
+
+    def __init__(self, my_context: Context):
+        self.__my_context = my_context
+        self.__files: [Path] = [
+            Path(path.abspath(path.join(path.dirname(__file__), MACRO_FILE))),
+            Path(self.__my_context.WORKSPACE, MACRO_FILE)
+        ]
+        self.__macros: [str, Scheme] = {}
+        self.__mtimes: [float | None] = []
+        self.__last_check: float = 0
+        # only one thread checks and reloads at a time
+        self.__lock = threading.Lock()
+        self.__load()
+
+    def get(self, name: str) -> Scheme | None:
+        self.__check_for_changes()
+        return self.__macros.get(name)
+
+    def __check_for_changes(self):
+        with self.__lock:
+            now: float = time.monotonic()
+            if now - self.__last_check < RELOAD_CHECK_INTERVAL:
+                return
+            self.__last_check = now
+            if self.__get_mtimes() != self.__mtimes:
+                self.__my_context.log.info("scheme macros have changed - reloading")
+                self.__load()
+
+    def __get_mtimes(self) -> [float | None]:
+        return [file.stat().st_mtime if file.exists() else None for file in self.__files]
+
+    def __load(self):
+        mtimes = self.__get_mtimes()
+        macros: [str, Scheme] = {}
+        try:
+            for file in self.__files:
+                if not file.exists():
+                    continue
+                self.__my_context.log.debug(f"loading scheme macros from {file}")
+                with open(file) as my_macros:
+                    for name, json_scheme in json.load(my_macros).items():
+                        macros[name.lower()] = compile_scheme(json_scheme)
+        except Exception as ex:
+            # we keep the previous macros in this case
+            self.__my_context.log.error(f"error loading scheme macros: {ex}")
+            return
+        finally:
+            self.__mtimes = mtimes
+        # replaced as a whole, so readers never see a half loaded table
+        self.__macros = macros
@@ -0,0 +1,186 @@
+import sys
+from collections import namedtuple
+from math import lcm
+from PinHandler.pin_bank import PinBank
+from PinHandler.scheme_table import Scheme
+from context import Context, is_raspberrypi
+
+if is_raspberrypi():
+    from pigpio import pulse, WAVE_MODE_REPEAT
+else:
+    # same fields as pigpio.pulse
+    pulse = namedtuple("pulse", ["gpio_on", "gpio_off", "delay"])
+    WAVE_MODE_REPEAT = 1
+
+# longest cycle (in ms) of the combined waveform. the cycle is the lcm of all scheme cycles.
+MAX_CYCLE: int = 60000
+# DMA control blocks pigpio needs at most for one pulse - switching on, switching off and the delay
+CBS_PER_PULSE: int = 3
+
+
+class WaveBackend:
+    """
+    drives endless schemes by a pigpio DMA waveform, so python only touches the pins
+    when a scheme starts, stops or changes.
+    pigpio can only transmit one waveform at a time. so all pins on the backend are
+    merged into one waveform, which restarts (in phase) whenever one of them changes.
+    when pigpio fails to transmit a waveform, the backend is turned off and all pins run in software.
+    """
+
+    def __init__(self, pin_bank: PinBank, my_context: Context):
+        self.__my_context = my_context
+        self.__pin_bank = pin_bank
+        self.connection = pin_bank.connection if pin_bank.connection else MockWaves()
+        self.__max_pulses: int = min(self.connection.wave_get_max_pulses(),
+                                     self.connection.wave_get_max_cbs() // CBS_PER_PULSE)
+        # the schemes running on the waveform
+        self.__schemes: [str, Scheme] = {}
+        self.__changed: bool = False
+        self.__wave_id: int | None = None
+        # set when pigpio has failed. no more pins are taken then.
+        self.__failed: bool = False
+
+    def assign(self, name: str, scheme: Scheme) -> bool:
+        """
+        moves the pin to the waveform
+        :return: False if the scheme can't be run by a waveform. The pin stays in software then.
+        """
+        self.release(name)
+        if self.__failed or scheme.repeat != sys.maxsize or len(scheme.segments) < 2:
+            return False
+        schemes = dict(self.__schemes)
+        schemes[name] = scheme
+        cycle = lcm(*[self.__cycle(s) for s in schemes.values()])
+        edges = sum(cycle // self.__cycle(s) * len(s.segments) for s in schemes.values())
+        if cycle > MAX_CYCLE or edges > self.__max_pulses:
+            self.__my_context.log.debug(f"{name} doesn't fit on the waveform - cycle {cycle} ms, {edges} edges")
+            return False
+        self.__pin_bank.detach(name)
+        self.__schemes[name] = scheme
+        self.__changed = True
+        return True
+
+    def release(self, name: str):
+        """
+        removes the pin from the waveform and hands it back to the pin bank
+        """
+        if name not in self.__schemes:
+            return
+        del self.__schemes[name]
+        self.__pin_bank.attach(name)
+        self.__changed = True
+
+    def update(self) -> [str, Scheme]:
+        """
+        transmits a new waveform if the assigned pins have changed since the last call
+        :return: the pins and their schemes that have to be run in software, as pigpio has failed. usually empty.
+        """
+        if not self.__changed:
+            return {}
+        self.__changed = False
+        old_wave_id = self.__wave_id
+        self.__wave_id = None
+        try:
+            if self.__schemes:
+                pulses = self.compile()
+                self.__my_context.log.debug(f"transmitting waveform for {list(self.__schemes)}, {len(pulses)} pulses")
+                self.connection.wave_add_generic(pulses)
+                self.__wave_id = self.connection.wave_create()
+                # the new wave replaces the old one immediately
+                self.connection.wave_send_using_mode(self.__wave_id, WAVE_MODE_REPEAT)
+            else:
+                self.connection.wave_tx_stop()
+            if old_wave_id is not None:
+                self.connection.wave_delete(old_wave_id)
+        except Exception as ex:
+            # e.g. no free wave id or DMA control blocks left
+            self.__my_context.log.error(f"waveform failed - running all pins in software from now on: {ex}")
+            return self.__fail([old_wave_id, self.__wave_id])
+        return {}
+
+    def __fail(self, wave_ids: [int | None]) -> [str, Scheme]:
+        """
+        stops the waveform and hands all pins back to the pin bank
+        :return: the schemes of the pins
+        """
+        self.__failed = True
+        try:
+            self.connection.wave_tx_stop()
+            for wave_id in wave_ids:
+                if wave_id is not None:
+                    self.connection.wave_delete(wave_id)
+        except Exception as ex:
+            self.__my_context.log.warning(f"couldn't clean up the waveforms: {ex}")
+        self.__wave_id = None
+        schemes, self.__schemes = self.__schemes, {}
+        for name in schemes:
+            self.__pin_bank.attach(name)
+        return schemes
+
+    def compile(self) -> [pulse]:
+        """
+        merges all assigned schemes into one cycle of pulses
+        :return: list of pulses - masks of the pins to switch on and off and the delay in µs until the next pulse
+        """
+        cycle = lcm(*[self.__cycle(s) for s in self.__schemes.values()])
+        # time in ms -> [on mask, off mask]
+        edges: [int, [int, int]] = {}
+        for name, scheme in self.__schemes.items():
+            my_pin = self.__pin_bank.get(name)
+            for start in range(0, cycle, self.__cycle(scheme)):
+                t = start
+                for value, duration in scheme.segments:
+                    # inverted pins are necessary for sirens
+                    level = 1 - value if my_pin.INVERTED_TRIGGER else value
+                    edges.setdefault(t, [0, 0])[0 if level else 1] |= 1 << my_pin.number
+                    t += duration
+        times = sorted(edges)
+        return [pulse(edges[t][0], edges[t][1], ((times[i + 1] if i + 1 < len(times) else cycle) - t) * 1000)
+                for i, t in enumerate(times)]
+
+    @staticmethod
+    def __cycle(scheme: Scheme) -> int:
+        return sum(duration for level, duration in scheme.segments)
+
+
+class MockWaves:
+    """
+    stands in for the wave functions of a pigpio connection when running on the mock factory.
+    records the waveforms, so they can be checked.
+    """
+
+    def __init__(self):
+        self.waves: [int, [pulse]] = {}
+        self.pending: [pulse] = []
+        # id of the transmitted wave or None
+        self.transmitting: int | None = None
+        self.__next_id: int = 0
+
+    def wave_get_max_pulses(self) -> int:
+        return 12000
+
+    def wave_get_max_cbs(self) -> int:
+        return 25016
+
+    def wave_add_generic(self, pulses: [pulse]) -> int:
+        self.pending.extend(pulses)
+        return len(self.pending)
+
+    def wave_create(self) -> int:
+        wave_id = self.__next_id
+        self.__next_id += 1
+        self.waves[wave_id] = self.pending
+        self.pending = []
+        return wave_id
+
+    def wave_send_using_mode(self, wave_id: int, mode: int) -> int:
+        self.transmitting = wave_id
+        return 0
+
+    def wave_tx_stop(self) -> int:
+        self.transmitting = None
+        return 0
+
+    def wave_delete(self, wave_id: int) -> int:
+        del self.waves[wave_id]
+        return 0
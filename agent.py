@@ -1,3 +1,4 @@
+import bisect
 import signal
 import sys
 
@@ -6,7 +7,12 @@ from PinHandler.pin_handler import PinHandler
 from PagedDisplay.my_lcd import MyLCD
 from Misc.status_job import StatusJob
 from Misc.audio_player import AudioPlayer
-import json
+from Misc.timer_wheel import TimerWheel
+from Misc.reconnect_supervisor import ReconnectSupervisor
+from Misc.broker_finder import BrokerFinder
+from Misc.command_dispatcher import CommandDispatcher, merge_visual
+from Misc import codec
+from Misc.publisher import Publisher, SENT_AT
 from uuid import uuid4
 from context import Context, is_raspberrypi
 import time
@@ -30,12 +36,21 @@ PROGRESS_ESCALATION = [
     [["wht", "red", "ylw", "grn", "blu"], "very_fast"],
     [["wht", "red", "ylw", "grn", "blu"], "mega_fast"],
 ]
+# ratios of elapsed time where the progress bar moves on to the next step of PROGRESS_ESCALATION.
+# step n starts halfway between n-1 and n.
+PROGRESS_THRESHOLDS: [float] = [0.0] + [(step - 0.5) / (len(PROGRESS_ESCALATION) - 1)
+                                        for step in range(1, len(PROGRESS_ESCALATION))]
 
 
 class Agent:
 
     def __init__(self, args):
+        self.__started_at: float = time.monotonic()
         self.__mqtt_client: mqtt.Client = None
+        # created after the first connection
+        self.__my_status_job: StatusJob | None = None
+        # the reconnect supervisor stays out of the way until we found a broker
+        self.__searching_broker: bool = False
         self.__prev_signal_quality: int = -1
         # contains the timer name when progress runs - empty otherwise
         self.__progress_bar: str = ""
@@ -49,18 +64,19 @@ class Agent:
         self.__lcd = MyLCD(self.__my_context)
         self.__my_context.variables["broker"] = "-none-"
         self.__my_context.store_local_ip_address()
-        # for the progress bar function
-        self.__my_context += self.__on_timer_changed
+        self.__timer_wheel = TimerWheel(self.__my_context)
         self.__my_audio_player: AudioPlayer = AudioPlayer(self.__my_context)
         self.__received_first_visual_led_msg_already = False
         self.__received_first_paged_msg_already = False
+        self.__command_dispatcher = CommandDispatcher(self.__my_context, self.__execute)
         self.__init_mqtt()
         if is_raspberrypi():
             from Misc import button_handler
-            button_handler.ButtonHandler(self.__mqtt_client, self.__my_context)
-            self.__rfid_handler = RfidHandler(self.__mqtt_client, self.__my_context)
-        self.__my_status_job = StatusJob(self.__mqtt_client, self.__my_context, self.__my_audio_player,
-                                         self.__rfid_handler.active)  # start the status job
+            button_handler.ButtonHandler(self.__publisher, self.__my_context)
+            self.__rfid_handler = RfidHandler(self.__publisher, self.__my_context)
+        self.__my_status_job = StatusJob(self.__publisher, self.__my_context, self.__my_audio_player,
+                                         self.__rfid_handler.active,
+                                         self.__command_dispatcher)  # start the status job
         signal.signal(signal.SIGTERM, self.__shutdown)
 
     def __shutdown(self, signum, frame):
@@ -83,12 +99,20 @@ class Agent:
         # Searching for a valid MQTT broker. Several addresses can be specified in the ~/.pyagent/config.json file
         # the agent will try them out until can establish a connection
         # then this broker will be kept
-        self.__mqtt_client = mqtt.Client(clean_session=self.__my_context.configs["network"]["mqtt"]["clean_session"],
-                                         client_id=self.__my_context.MY_ID + str(uuid4()))
+        if self.__my_context.MQTT_V5:
+            # clean_start is set on connect
+            self.__mqtt_client = mqtt.Client(client_id=self.__my_context.MY_ID + str(uuid4()), protocol=mqtt.MQTTv5)
+        else:
+            self.__mqtt_client = mqtt.Client(clean_session=self.__my_context.configs["network"]["mqtt"]["clean_session"],
+                                             client_id=self.__my_context.MY_ID + str(uuid4()))
+        self.__publisher = Publisher(self.__mqtt_client, self.__my_context)
         self.__mqtt_client.max_inflight_messages_set(self.__my_context.configs["network"]["mqtt"]["max_inflight"])
         self.__mqtt_client.on_connect = self.on_connect
         self.__mqtt_client.on_disconnect = self.on_disconnect
         self.__mqtt_client.on_message = self.on_message
+        self.__reconnect_supervisor = ReconnectSupervisor(self.__mqtt_client, self.__my_context,
+                                                          self.__on_reconnect_attempt)
+        self.__broker_finder = BrokerFinder(self.__my_context)
         self.__search_for_broker()
         self.__post_init_page()
 
@@ -110,13 +134,19 @@ class Agent:
             "WiFi: ${wifi}  ${wifi_signal}"
         ]})
 
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         self.__connected = True
+        self.__reconnect_supervisor.connected()
+        self.__publisher.connected(properties)
+        self.__broker_finder.remember(self.__my_context.mqtt_broker)
         self.__my_context.log.info("Connected to mqtt broker")
         self.__my_context.num_of_reconnects += 1
         self.__mqtt_client.subscribe(self.__my_context.MQTT_INBOUND, qos=self.__my_context.MQTT_CMD_QOS)
         # store local ip address
         self.__my_context.store_local_ip_address()
+        if self.__my_status_job:
+            # a fresh full status for the server
+            self.__my_status_job.request_status()
         if not self.__received_first_visual_led_msg_already:
             net_status: [str, str] = {"wht": "signal_strength",
                                       "red": "off",
@@ -130,12 +160,12 @@ class Agent:
         if self.__progress_bar != key_name:
             return
         if new_value == 0:
-            self.__progress_bar = ""
+            self.__set_progress_bar("")
             self.__my_pin_handler.proc_pins({"led_all": "very_long"})  # one last signal, then off
             return
         ratio: float = 1 - new_value / old_value
-        progress_steps: int = len(PROGRESS_ESCALATION) - 1
-        step: int = round(ratio * progress_steps)
+        # the same thresholds the timer wheel uses to notify us
+        step: int = bisect.bisect_right(PROGRESS_THRESHOLDS, ratio) - 1
         self.__my_context.log.trace(f"Progress: {round(ratio * 100, 2)}%")
         if step == self.__previous_step:  # only set LEDs when necessary
             return
@@ -149,119 +179,199 @@ class Agent:
         self.__my_context.log.trace(my_scheme)
         self.__my_pin_handler.proc_pins(my_scheme)
 
-    def on_disconnect(self, my_client, userdata, msg):
+    def __set_progress_bar(self, key: str):
+        """
+        lets the progress bar follow the timer with this name. empty string to stop it.
+        we are only notified when the timer reaches the next step - not on every second.
+        """
+        if self.__progress_bar:
+            self.__timer_wheel.unsubscribe(self.__progress_bar, self.__on_timer_changed)
+        self.__progress_bar = key
+        self.__previous_step = -1
+        if key:
+            self.__timer_wheel.subscribe(key, self.__on_timer_changed, PROGRESS_THRESHOLDS)
+
+    def on_disconnect(self, my_client, userdata, rc, properties=None):
         self.__connected = False
-        self.__my_context.log.info("disconnected")
-        while not self.__connected:
-            time.sleep(2)
-            try:
-                self.__my_context.log.debug("trying to reconnect")
-                if not self.__lcd.is_lcd_is_in_use():
-                    self.__render_signal_quality(self.__my_context.get_current_wifi_signal_strength()[0])
-                self.__mqtt_client.reconnect()
-                self.__connected = True
-            except OSError as ose:
-                self.__connected = False
-                self.__my_context.log.debug(f"error while trying to reconnect - {ose}")
+        self.__my_context.log.info(f"disconnected ({rc})")
+        # runs on the paho network thread - the supervisor does the reconnecting
+        if not self.__searching_broker:
+            self.__reconnect_supervisor.disconnected()
+
+    def __on_reconnect_attempt(self):
+        if not self.__lcd.is_lcd_is_in_use():
+            self.__render_signal_quality(self.__my_context.get_current_wifi_signal_strength()[0])
 
     def on_message(self, my_client, userdata, msg):
-        # "normal", "normal", "fast", "fast", "very_fast"
+        # runs on the paho network thread - so we only decode here. the subsystems work on their own threads.
         try:
-            cmd = msg.topic.rsplit('/', 1)[1]
-            self.__my_context.log.debug(f"received '{msg.payload}' from '{msg.topic}' cmd '{cmd}'")
-            params_json = json.loads(msg.payload.decode('UTF-8'))
-            match cmd:
-                case "visual":
-                    """
-                        /visual/ {"progress": "remaining"}
-                        only useful in combination with a timer of the same name - see below                        
-                        will use the leds to show the time progression "remaining"
-                    """
-                    if "progress" in params_json:
-                        self.__my_pin_handler.leds_off()
-                        self.__progress_bar = params_json["progress"]
-                        self.__previous_step = -1
-                    else:
-                        self.__my_pin_handler.proc_pins(params_json)
-                        self.__progress_bar = ""
-                    self.__received_first_visual_led_msg_already = True
-                case "acoustic":
-                    self.__my_pin_handler.proc_pins(params_json)
-                case "paged":
-                    self.__lcd.proc_paged(params_json)
-                    self.__received_first_paged_msg_already = True
-                case "play":
-                    self.__my_audio_player.proc_play(params_json)
-                case "rfid":
-                    """
-                        sets the mode how to handle rfid events
-                        {
-                            "mode": "mobile_spawn", "max_spawn_counter": 3 
-                            | "mode": "report_tag" 
-                            | "mode": "init_player_tags"
-                            
-                        }
-                    """
-                    if is_raspberrypi() and self.__rfid_handler:
-                        self.__rfid_handler.proc_rfid(params_json)
-                case "timers":
-                    """
-                        /timer/ {"remaining": 120}
-                        timer variables can be used on the LCD screen as 
-                        ${variables} with a autoformat like mm:ss or hh:mm:ss 
-                    """
-                    if "_clearall" in params_json.keys():
-                        # removes all timers
-                        self.__my_context.clear_timers()
-                    else:
-                        for key, value in params_json.items():
-                            try:
-                                # make sure that strings and ints are accepted
-                                # refuse otherwise
-                                self.__my_context.set_timer(key, int(value))
-                            except ValueError:
-                                self.__my_context.log.warning(f"Invalid timer {value}")
-                case "vars":
-                    for key, value in params_json.items():
-                        # variables are always strings
-                        self.__my_context.variables[key] = str(value)
-                case "reset_status":
-                    self.__my_context.reset_stats()
-                case "status":
-                    self.__my_status_job.send_status(self.__my_context.get_current_wifi_signal_strength())
-                case _:
-                    self.__my_context.log.warning(f"got command '{cmd}' but don't know what to do with it")
+            self.__my_context.log.debug(f"received '{msg.payload}' from '{msg.topic}'")
+            properties = getattr(msg, "properties", None)
+            # json - or msgpack, marked by the topic suffix .mp or the content type (MQTT v5)
+            cmd, params_json = codec.decode(msg.topic, msg.payload, getattr(properties, "ContentType", None))
+            expires_at: float | None = None
+            if properties is not None:
+                # the broker has already counted down the time the message waited there
+                if hasattr(properties, "MessageExpiryInterval"):
+                    expires_at = time.monotonic() + properties.MessageExpiryInterval
+                for name, value in getattr(properties, "UserProperty", []):
+                    if name == SENT_AT:
+                        self.__my_context.command_latency.add(max(0.0, (time.time() - float(value)) * 1000))
+            self.__command_dispatcher.dispatch(cmd, params_json, expires_at)
         except Exception as ex:
             message = "An exception of type {0} occurred. Arguments:\n{1!r}".format(type(ex).__name__, ex.args)
             self.__my_context.log.warning(f"{message}")
             self.__my_context.log.warning("exception occurred while receiving an mqtt message. Ignoring it.")
 
-    def __search_for_broker(self) -> str:
+    def __execute(self, cmd: str, params_json):
+        """
+        carries out a command. called by the worker of the command's subsystem (see CommandDispatcher).
+        """
+        match cmd:
+            case "visual":
+                """
+                    /visual/ {"progress": "remaining"}
+                    only useful in combination with a timer of the same name - see below                        
+                    will use the leds to show the time progression "remaining"
+                """
+                if "progress" in params_json:
+                    self.__my_pin_handler.leds_off()
+                    self.__set_progress_bar(params_json["progress"])
+                else:
+                    self.__my_pin_handler.proc_pins(params_json)
+                    self.__set_progress_bar("")
+                self.__received_first_visual_led_msg_already = True
+            case "acoustic":
+                self.__my_pin_handler.proc_pins(params_json)
+            case "paged":
+                self.__lcd.proc_paged(params_json)
+                self.__received_first_paged_msg_already = True
+            case "paged_patch":
+                """
+                    /paged_patch/ {"page1": {"2": "new line 2"}, "page2": ["a", "b"], "page3": null}
+                    changes single lines and pages without rebuilding the whole display - see MyLCD.proc_patch
+                """
+                self.__lcd.proc_patch(params_json)
+                self.__received_first_paged_msg_already = True
+            case "play":
+                self.__my_audio_player.proc_play(params_json)
+            case "rfid":
+                """
+                    sets the mode how to handle rfid events
+                    {
+                        "mode": "mobile_spawn", "max_spawn_counter": 3 
+                        | "mode": "report_tag" 
+                        | "mode": "init_player_tags"
+                        
+                    }
+                """
+                if is_raspberrypi() and self.__rfid_handler:
+                    self.__rfid_handler.proc_rfid(params_json)
+            case "timers":
+                """
+                    /timer/ {"remaining": 120}
+                    timer variables can be used on the LCD screen as 
+                    ${variables} with a autoformat like mm:ss or hh:mm:ss 
+                """
+                if "_clearall" in params_json.keys():
+                    # removes all timers
+                    self.__timer_wheel.clear_timers()
+                else:
+                    for key, value in params_json.items():
+                        try:
+                            # make sure that strings and ints are accepted
+                            # refuse otherwise
+                            self.__timer_wheel.set_timer(key, int(value))
+                        except ValueError:
+                            self.__my_context.log.warning(f"Invalid timer {value}")
+            case "vars":
+                # variables are always strings
+                self.__my_context.variables.update({key: str(value) for key, value in params_json.items()})
+            case "loglevel":
+                """
+                    /loglevel/ {"pins": "TRACE", "lcd": "default"}
+                    changes the log level of the main logger (agent) or of a subsystem (pins, lcd, timers)
+                """
+                self.__my_context.set_log_levels(params_json)
+            case "batch":
+                self.__execute_batch(params_json)
+            case "reset_status":
+                self.__my_context.reset_stats()
+            case "status":
+                # before the status job is up, its first run sends the full status anyway
+                if self.__my_status_job:
+                    self.__my_status_job.request_status()
+            case _:
+                self.__my_context.log.warning(f"got command '{cmd}' but don't know what to do with it")
+
+    def __execute_batch(self, commands: [dict]):
+        """
+            /batch/ [{"vars": {"score": "12"}}, {"paged": {...}}, {"visual": {...}}, {"timers": {...}}]
+            applies the sub commands in their order as one step. the LCD shows nothing of them until all are done
+            and all changes of the pins (visual and acoustic) take effect at the same time.
+        """
+        if isinstance(commands, dict):
+            # a single object keeps its order as well
+            commands = [{cmd: params} for cmd, params in commands.items()]
+        # the merged pin changes that haven't been handed over to the pin handler yet
+        pins: dict = {}
+        visual: bool = False
+
+        def flush_pins():
+            nonlocal pins, visual
+            if visual:
+                self.__set_progress_bar("")
+                self.__received_first_visual_led_msg_already = True
+            if pins:
+                self.__my_pin_handler.proc_pins(pins)
+            pins, visual = {}, False
+
+        with self.__lcd.hold():
+            for command in commands:
+                for cmd, params in command.items():
+                    try:
+                        if cmd in ["visual", "acoustic"] and "progress" not in params:
+                            pins = merge_visual(pins, params)
+                            visual = visual or cmd == "visual"
+                        elif cmd == "batch":
+                            self.__my_context.log.warning("batches can't be nested. Ignoring it.")
+                        else:
+                            if cmd == "visual":
+                                # the progress bar switches off the leds of the batch so far
+                                flush_pins()
+                            self.__execute(cmd, params)
+                    except Exception as ex:
+                        self.__my_context.log.warning(f"error in batch command '{cmd}': {ex}. Ignoring it.")
+            flush_pins()
+
+    def __search_for_broker(self):
         self.__pre_init_page()
-        trying_broker_with_index: int = 0
-        mqtt_broker: str = ""
+        self.__searching_broker = True
         while not self.__connected:
-            # if the context has a broker already, then we must be reconnecting. No need to try out all brokers again
-            mqtt_broker = self.__my_context.mqtt_broker if self.__my_context.mqtt_broker \
-                else self.__my_context.configs["network"]["mqtt"]["broker"][trying_broker_with_index]
-
             self.__render_signal_quality(self.__my_context.get_current_wifi_signal_strength()[0])
-            try:
-                self.__my_context.log.info(f"trying broker: '{mqtt_broker}'")
-                self.__my_context.variables["broker"] = mqtt_broker
-                self.__mqtt_client.connect(mqtt_broker, port=self.__my_context.MQTT_PORT,
-                                           keepalive=self.__my_context.configs["network"]["mqtt"]["keepalive"])
-                self.__mqtt_client.loop_start()
+            # all brokers are probed at once. the one that worked last time comes first.
+            brokers: [str] = self.__broker_finder.find()
+            if not brokers:
+                self.__my_context.log.info("no broker answered - retrying")
                 time.sleep(2)
-            except OSError as os_ex:
-                trying_broker_with_index += 1
-                if trying_broker_with_index >= len(self.__my_context.configs["network"]["mqtt"]["broker"]):
-                    trying_broker_with_index = 0
-                self.__my_context.log.info(f"couldn't connect- retrying broker {os_ex}")
-            except Exception as e:
-                self.__my_context.log.error(f"search_for_broker exception{e}")
-
-        self.__my_context.mqtt_broker = mqtt_broker
+                continue
+            for mqtt_broker in brokers:
+                try:
+                    self.__my_context.log.info(f"trying broker: '{mqtt_broker}'")
+                    self.__my_context.variables["broker"] = mqtt_broker
+                    self.__my_context.mqtt_broker = mqtt_broker
+                    self.__mqtt_client.connect(mqtt_broker, **self.__my_context.mqtt_connect_options())
+                    self.__mqtt_client.loop_start()
+                    if self.__reconnect_supervisor.wait_connected(2):
+                        break
+                    self.__mqtt_client.loop_stop()
+                except OSError as os_ex:
+                    self.__my_context.log.info(f"couldn't connect- retrying broker {os_ex}")
+                except Exception as e:
+                    self.__my_context.log.error(f"search_for_broker exception{e}")
+        self.__searching_broker = False
+        self.__my_context.time_to_connected = time.monotonic() - self.__started_at
+        self.__my_context.log.info(f"connected {round(self.__my_context.time_to_connected, 2)} secs after the start")
 
     def __render_signal_quality(self, signal_quality: int):
         """
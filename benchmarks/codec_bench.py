@@ -0,0 +1,125 @@
+"""
+compares the payload sizes and the encode/decode times of json and our msgpack codec (Misc/codec.py)
+for typical commands and the status message.
+
+usage: python -m benchmarks.codec_bench [--iterations 20000] [--output report.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from os import path
+
+# the agent's modules are imported relative to the project root
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..")))
+
+from Misc import codec
+
+# what the agents usually get and send
+PAYLOADS = {
+    "visual": {"led_all": "off", "wht": "normal", "red": "fast"},
+    "visual_progress": {"progress": "remaining"},
+    "acoustic": {"sir1": "long", "buzzer": "double_buzz"},
+    "paged": {
+        "page0": ["Conquest ${agentname}", "Red: ${red_tickets}", "Blue: ${blue_tickets}", "Time: ${remaining}"],
+        "page1": ["Flag is ${flag}", "", "${wifi_signal}", "Score ${score}"],
+    },
+    "vars": {"red_tickets": "187", "blue_tickets": "203", "flag": "RED", "score": "1200"},
+    "timers": {"remaining": 1200},
+    "play": {"channel": "voice1", "subpath": "announce", "soundfile": "<random>"},
+    "batch": [
+        {"vars": {"red_tickets": "187", "blue_tickets": "203"}},
+        {"visual": {"led_all": "off", "red": "fast"}},
+        {"acoustic": {"sir1": "medium"}},
+        {"timers": {"remaining": 600}},
+    ],
+    "status": {
+        "version": "pyAgent 1.0b99",
+        "reconnects": 0,
+        "mqtt-broker": "192.168.0.10",
+        "failed_pings": 0,
+        "status_counter": 1440,
+        "ip": "192.168.0.42",
+        "ap": "AA:BB:CC:DD:EE:FF",
+        "ssid": "RLG-Field",
+        "signal_quality": 78,
+        "timestamp": "2024-06-30T21:29:00.123456",
+        "rfid_is_active": False,
+        "lcd_bytes_per_sec": 12.5,
+        "reconnect_latency": {"buckets": {"1": 0, "2": 1, "5": 0, "10": 0, "30": 0, "60": 0, "120": 0, "300": 0,
+                                          "+inf": 0}, "count": 1, "mean": 1.5, "max": 1.5},
+        "time_to_connected": 1.84,
+    },
+}
+
+
+# floats that need float64 or are special
+FLOATS: [float] = [0.5, 1.1, 3.4e38, 1e39, 1e300, -1e300, 2.2e-308, float("inf"), float("-inf"), float("nan")]
+
+
+def check_floats():
+    """
+    every float has to come back as it was - NaN included
+    """
+    for value in FLOATS:
+        result = codec.unpackb(codec.packb(value))
+        assert result == value or (result != result and value != value), f"{value} came back as {result}"
+        assert codec.unpackb(codec.packb({"value": [value]})) == {"value": [value]} or value != value
+
+
+def measure(function, argument, iterations: int) -> float:
+    """
+    :return: µs per call
+    """
+    started = time.perf_counter()
+    for i in range(iterations):
+        function(argument)
+    return (time.perf_counter() - started) / iterations * 1000000
+
+
+def run_payload(obj, iterations: int) -> dict:
+    json_payload: bytes = json.dumps(obj).encode("UTF-8")
+    msgpack_payload: bytes = codec.packb(obj)
+    # the codec has to give back what it got
+    assert codec.unpackb(msgpack_payload) == json.loads(json_payload)
+    return {
+        "json_bytes": len(json_payload),
+        "msgpack_bytes": len(msgpack_payload),
+        "size_ratio": round(len(msgpack_payload) / len(json_payload), 3),
+        "json_encode_us": round(measure(lambda o: json.dumps(o).encode("UTF-8"), obj, iterations), 2),
+        "msgpack_encode_us": round(measure(codec.packb, obj, iterations), 2),
+        "json_decode_us": round(measure(lambda p: json.loads(p.decode("UTF-8")), json_payload, iterations), 2),
+        "msgpack_decode_us": round(measure(codec.unpackb, msgpack_payload, iterations), 2),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="compares json and msgpack for the agent's payloads")
+    parser.add_argument("--iterations", type=int, default=20000, help="calls per payload and operation")
+    parser.add_argument("--output", help="file for the json report. stdout otherwise.")
+    args = parser.parse_args(args)
+
+    check_floats()
+
+    payloads = {name: run_payload(obj, args.iterations) for name, obj in PAYLOADS.items()}
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "iterations": args.iterations,
+        "payloads": payloads,
+        "total_json_bytes": sum(p["json_bytes"] for p in payloads.values()),
+        "total_msgpack_bytes": sum(p["msgpack_bytes"] for p in payloads.values()),
+    }
+
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
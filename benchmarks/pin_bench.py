@@ -0,0 +1,209 @@
+"""
+benchmarks the pin engine (PinHandler, PinScheme, PinBank) on gpiozero's MockFactory.
+runs headless on any linux box and writes a json report.
+
+usage: python -m benchmarks.pin_bench [--duration 5] [--output report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+from pathlib import PurePath
+
+# the agent's modules are imported relative to the project root
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..")))
+
+from context import Context
+from PinHandler.pin_handler import PinHandler, TickStats, ALL_LEDS, ALL_SIRENS
+
+# same as agent.PROGRESS_ESCALATION - not imported to keep paho and the LCD out of the benchmark
+PROGRESS_ESCALATION = [
+    [["wht"], "normal"],
+    [["wht"], "fast"],
+    [["wht"], "very_fast"],
+    [["wht", "red"], "normal"],
+    [["wht", "red"], "fast"],
+    [["wht", "red"], "very_fast"],
+    [["wht", "red", "ylw"], "normal"],
+    [["wht", "red", "ylw"], "fast"],
+    [["wht", "red", "ylw"], "very_fast"],
+    [["wht", "red", "ylw", "grn"], "normal"],
+    [["wht", "red", "ylw", "grn"], "fast"],
+    [["wht", "red", "ylw", "grn"], "very_fast"],
+    [["wht", "red", "ylw", "grn", "blu"], "fast"],
+    [["wht", "red", "ylw", "grn", "blu"], "very_fast"],
+    [["wht", "red", "ylw", "grn", "blu"], "mega_fast"],
+]
+MACROS = ["very_long", "long", "medium", "short", "very_short", "very_slow", "slow", "normal", "fast",
+          "very_fast", "mega_fast", "signal_strength", "no_wifi", "single_buzz", "double_buzz", "triple_buzz",
+          "annoying", "flag_taken", "respawn_signal"]
+PIN_FILES = ["pin_handler.py", "pin_scheme.py", "pin_bank.py", "scheme_table.py", "wave_backend.py"]
+
+CONFIG = {
+    "my_id": "bench",
+    "loglevel": "WARNING",
+    "network": {"device": "wlan0", "mqtt": {"root": "bench", "port": 1883, "broker": []}},
+    "hardware": {
+        "triggered_on_low": ["sir1", "sir2", "sir3", "sir4"],
+        "wht": "GPIO5", "red": "GPIO6", "ylw": "GPIO13", "grn": "GPIO19", "blu": "GPIO26",
+        "buzzer": "GPIO21", "sir1": "GPIO17", "sir2": "GPIO27", "sir3": "GPIO22", "sir4": "GPIO23"
+    }
+}
+
+
+def idle(step: int, rnd: random.Random) -> dict | None:
+    return None
+
+
+def macro_storm(step: int, rnd: random.Random) -> dict | None:
+    return {pin: rnd.choice(MACROS) for pin in rnd.sample(ALL_LEDS + ALL_SIRENS, 3)}
+
+
+def led_all_toggle(step: int, rnd: random.Random) -> dict | None:
+    return {"led_all": "off" if step % 2 else "fast"}
+
+
+def progress_escalation(step: int, rnd: random.Random) -> dict | None:
+    pins, speed = PROGRESS_ESCALATION[step % len(PROGRESS_ESCALATION)]
+    return {pin: speed for pin in pins}
+
+
+def endless_patterns(step: int, rnd: random.Random) -> dict | None:
+    # one message at the start - then the engine runs on its own
+    if step:
+        return None
+    return {"wht": "normal", "red": "fast", "ylw": "very_fast", "grn": "mega_fast", "blu": "signal_strength"}
+
+
+# name -> (messages per second, message generator)
+WORKLOADS = {
+    "idle": (1, idle),
+    "endless_patterns": (1, endless_patterns),
+    "macro_storm": (50, macro_storm),
+    "led_all_toggle": (10, led_all_toggle),
+    "progress_escalation": (5, progress_escalation),
+}
+
+
+def percentile(values: [float], pct: int) -> float:
+    if not values:
+        return 0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def drive(pin_handler: PinHandler, rate: int, workload, duration: float) -> int:
+    """
+    sends the workload's messages at the given rate
+    :return: number of messages sent
+    """
+    rnd = random.Random(4711)
+    messages = 0
+    started = time.monotonic()
+    step = 0
+    while time.monotonic() - started < duration:
+        message = workload(step, rnd)
+        if message:
+            pin_handler.proc_pins(message)
+            messages += 1
+        step += 1
+        # keep the rate without drifting
+        time.sleep(max(0.0, started + step / rate - time.monotonic()))
+    return messages
+
+
+def reset(pin_handler: PinHandler):
+    pin_handler.leds_off()
+    pin_handler.sirens_off()
+    time.sleep(0.1)
+
+
+def run_workload(pin_handler: PinHandler, name: str, duration: float) -> dict:
+    rate, workload = WORKLOADS[name]
+    reset(pin_handler)
+
+    # timing pass - without tracemalloc, as it slows down every allocation
+    tick_stats = TickStats()
+    writes, edges = pin_handler.pin_bank.writes, pin_handler.pin_bank.edges
+    cpu_started = time.process_time()
+    pin_handler.tick_stats = tick_stats
+    messages = drive(pin_handler, rate, workload, duration)
+    pin_handler.tick_stats = None
+    cpu = time.process_time() - cpu_started
+    writes, edges = pin_handler.pin_bank.writes - writes, pin_handler.pin_bank.edges - edges
+
+    # memory pass
+    reset(pin_handler)
+    tracemalloc.start()
+    drive(pin_handler, rate, workload, duration / 2)
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    pin_stats = [stat for stat in snapshot.statistics("filename")
+                 if PurePath(stat.traceback[0].filename).name in PIN_FILES]
+
+    durations = [d * 1000000 for d in tick_stats.durations]
+    lateness = [d * 1000000 for d in tick_stats.lateness]
+    return {
+        "duration_secs": duration,
+        "messages": messages,
+        "ticks": len(durations),
+        "ticks_per_sec": round(len(durations) / duration, 1),
+        "tick_mean_us": round(statistics.fmean(durations), 1) if durations else 0,
+        "tick_p99_us": round(percentile(durations, 99), 1),
+        "tick_max_us": round(max(durations, default=0), 1),
+        "jitter_mean_us": round(statistics.fmean(lateness), 1) if lateness else 0,
+        "jitter_p99_us": round(percentile(lateness, 99), 1),
+        "jitter_max_us": round(max(lateness, default=0), 1),
+        "gpio_writes_per_sec": round(writes / duration, 1),
+        "pin_edges_per_sec": round(edges / duration, 1),
+        "cpu_percent": round(cpu / duration * 100, 2),
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "alloc_pin_engine_kb": round(sum(stat.size for stat in pin_stats) / 1024, 1),
+        "alloc_pin_engine_blocks": sum(stat.count for stat in pin_stats),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="benchmarks the pin engine on gpiozero's MockFactory")
+    parser.add_argument("--duration", type=float, default=5, help="secs per workload")
+    parser.add_argument("--output", help="file for the json report. stdout otherwise.")
+    parser.add_argument("--workload", action="append", choices=list(WORKLOADS),
+                        help="run only this workload. can be repeated.")
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as workspace:
+        with open(PurePath(workspace, "config.json"), "w") as config:
+            json.dump(CONFIG, config)
+        my_context = Context(workspace)
+        pin_handler = PinHandler(my_context)
+        report = {
+            "agent": f"{my_context.variables['agversion']}b{my_context.variables['agbuild']}",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "workloads": {name: run_workload(pin_handler, name, args.duration)
+                          for name in (args.workload or WORKLOADS)}
+        }
+
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text)
+    else:
+        print(text)
+    sys.stdout.flush()
+    # the PinHandler thread runs forever
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+checks the waveforms the WaveBackend compiles for endless schemes - and what happens when pigpio fails.
+runs without hardware: the pulses are recorded by MockWaves instead of being sent to pigpio.
+
+usage: python -m benchmarks.wave_check
+"""
+import json
+import sys
+import tempfile
+from os import path
+from pathlib import PurePath
+
+# the agent's modules are imported relative to the project root
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..")))
+
+from context import Context
+from PinHandler.pin_bank import PinBank
+from PinHandler.scheme_table import SchemeTable
+from PinHandler.wave_backend import WaveBackend, MockWaves, pulse
+from benchmarks.pin_bench import CONFIG
+
+WHT: int = 1 << 5  # GPIO5
+RED: int = 1 << 6  # GPIO6
+
+
+def check(my_context: Context, pin_bank: PinBank, schemes: SchemeTable):
+    backend = WaveBackend(pin_bank, my_context)
+    waves: MockWaves = backend.connection
+    assert isinstance(waves, MockWaves)
+
+    # a single scheme: 500 ms on, 500 ms off
+    assert backend.assign("wht", schemes.get("fast"))
+    assert backend.compile() == [pulse(WHT, 0, 500000), pulse(0, WHT, 500000)]
+    backend.update()
+    first_wave = waves.transmitting
+    assert first_wave is not None
+    assert waves.waves == {first_wave: [pulse(WHT, 0, 500000), pulse(0, WHT, 500000)]}
+
+    # fast (1000 ms cycle) and normal (2000 ms cycle) are merged over 2000 ms
+    assert backend.assign("red", schemes.get("normal"))
+    merged = [pulse(WHT | RED, 0, 500000), pulse(0, WHT, 500000), pulse(WHT, RED, 500000), pulse(0, WHT, 500000)]
+    assert backend.compile() == merged
+    backend.update()
+    # the new wave replaces the old one
+    assert waves.transmitting not in [None, first_wave]
+    assert waves.waves == {waves.transmitting: merged}
+
+    # nothing left on the waveform - the transmission stops
+    backend.release("wht")
+    backend.release("red")
+    backend.update()
+    assert waves.transmitting is None
+    assert waves.waves == {}
+
+
+def check_failure(my_context: Context, pin_bank: PinBank, schemes: SchemeTable):
+    backend = WaveBackend(pin_bank, my_context)
+    waves: MockWaves = backend.connection
+    assert backend.assign("wht", schemes.get("fast"))
+
+    def no_more_cbs():
+        raise RuntimeError("No more CBs for waveform")
+
+    # pigpio fails - the pins are given back to run in software and the backend takes no more
+    waves.wave_create = no_more_cbs
+    assert backend.update() == {"wht": schemes.get("fast")}
+    assert waves.transmitting is None
+    assert not backend.assign("red", schemes.get("normal"))
+    assert backend.update() == {}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workspace:
+        with open(PurePath(workspace, "config.json"), "w") as config:
+            json.dump(CONFIG, config)
+        my_context = Context(workspace)
+        pin_bank = PinBank(my_context)
+        for name in ["wht", "red"]:
+            pin_bank.add(name)
+        schemes = SchemeTable(my_context)
+        check(my_context, pin_bank, schemes)
+        check_failure(my_context, pin_bank, schemes)
+    print("waveforms ok")
+
+
+if __name__ == "__main__":
+    main()
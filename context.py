@@ -7,7 +7,8 @@ import json
 import logging
 import io
 import sys
-from datetime import datetime, timedelta
+from variable_store import VariableStore
+from Misc.histogram import Histogram
 
 TRACE = 5
 
@@ -33,12 +34,18 @@ class Context:
     def __init__(self, workspace: str):
         with open(PurePath(workspace, "config.json")) as my_config_file:
             self.configs: {} = json.load(my_config_file)
-        self.variables: [str, str] = {}
-        self.__timer_listeners = []
-        self.__timers: [str, [float, float]] = {}
+        self.variables: VariableStore = VariableStore()
         self.__WIFI_DEVICE: str = self.configs["network"]["device"]
         self.IPADDRESS = "0.0.0.0"
         self.num_of_reconnects: int = 0
+        # secs from losing the mqtt connection until it was back again
+        self.reconnect_latency: Histogram = Histogram([1, 2, 5, 10, 30, 60, 120, 300])
+        # secs from the start of the agent until the first connection to a broker. None until then.
+        self.time_to_connected: float | None = None
+        # ms from sending a command (user property sent_at, MQTT v5 only) until we received it
+        self.command_latency: Histogram = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+        # bytes (chars and commands) sent to the LCD since the start
+        self.lcd_bytes_written: int = 0
         self.WORKSPACE = workspace
         self.MY_ID: str = self.configs.get("my_id", "ag99")
         self.variables["agentname"] = self.MY_ID
@@ -50,6 +57,10 @@ class Context:
         self.MQTT_OUTBOUND: str = self.MQTT_ROOT_TOPIC + "/evt/" + self.MY_ID
         self.MQTT_PORT: int = int(self.configs["network"]["mqtt"]["port"])
         self.MQTT_INBOUND: str = self.MQTT_ROOT_TOPIC + "/cmd/" + self.MY_ID + "/#"
+        # json or msgpack (see Misc/codec.py) for our events. commands are accepted in both encodings.
+        self.MQTT_ENCODING: str = self.configs["network"]["mqtt"].get("encoding", "json")
+        # opt-in MQTT v5 (topic aliases, message expiry, user properties) with network.mqtt.protocol 5
+        self.MQTT_V5: bool = int(self.configs["network"]["mqtt"].get("protocol", 4)) == 5
         # QOS OUTBOUND
         self.MQTT_STATUS_QOS: int = int(self.configs.get("network", {}).get("mqtt", {}).get("qos", {}).get("status", 0))
         self.MQTT_BUTTON_QOS: int = int(self.configs.get("network", {}).get("mqtt", {}).get("qos", {}).get("button", 2))
@@ -71,12 +82,16 @@ class Context:
         logging.addLevelName(TRACE, "TRACE")
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         fh = logging.FileHandler(PurePath(workspace, "agent.log"))
-        fh.setLevel(self.configs["loglevel"])
+        # the handlers let everything pass. the levels of the loggers decide what is written,
+        # so subsystems can be switched to TRACE at runtime (see set_log_levels)
+        fh.setLevel(TRACE)
         fh.setFormatter(formatter)
         self.log = logging.getLogger("mylogger")
+        self.log.setLevel(self.LOG_LEVEL)
         self.log.addHandler(fh)
         logging.Logger.trace = trace
-        coloredlogs.install(level=logging.getLevelName(self.configs["loglevel"]))
+        coloredlogs.install(level=TRACE)
+        logging.getLogger().setLevel(self.LOG_LEVEL)
 
         if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
             self.log.info('running in a PyInstaller bundle')
@@ -92,8 +107,40 @@ class Context:
             self.variables["agbuild"] = version["buildnumber"]
             self.log.info(f"pyAgent v{version['version']} b{version['buildnumber']}-{version['timestamp']}")
 
+    def get_logger(self, subsystem: str) -> logging.Logger:
+        """
+        hot loops log through their own subsystem logger and check isEnabledFor(TRACE)
+        before they build a message. so tracing costs nothing until it is switched on.
+        :param subsystem: e.g. pins, lcd, timers
+        :return: child of the main logger. follows its level unless set otherwise.
+        """
+        return self.log.getChild(subsystem)
+
+    def set_log_levels(self, levels: {str: str}):
+        """
+        changes the log levels at runtime, e.g. {"pins": "TRACE", "lcd": "default"}
+        :param levels: subsystem -> level. "agent" is the main logger.
+                       "default" lets a subsystem follow the main logger again.
+        """
+        for subsystem, level in levels.items():
+            logger = self.log if subsystem == "agent" else self.get_logger(subsystem)
+            level = str(level).upper()
+            self.log.info(f"setting log level of '{subsystem}' to {level}")
+            logger.setLevel(logging.NOTSET if level == "DEFAULT" else level)
+
     def reset_stats(self):
         self.num_of_reconnects = 0
+        self.reconnect_latency.reset()
+        self.command_latency.reset()
+
+    def mqtt_connect_options(self) -> dict:
+        """
+        :return: keyword args for mqtt.Client.connect. clean_start only exists with MQTT v5.
+        """
+        options = {"port": self.MQTT_PORT, "keepalive": self.configs["network"]["mqtt"]["keepalive"]}
+        if self.MQTT_V5:
+            options["clean_start"] = self.configs["network"]["mqtt"]["clean_session"]
+        return options
 
     def store_local_ip_address(self):
         ip: str = "0.0.0.0"
@@ -126,75 +173,10 @@ class Context:
         self.set_wifi_vars(signal_quality)
         return signal_quality, ssid, ap
 
-    def calculate_timers(self, last_cycle_started_at: float, now: float):
-        time_difference_since_last_cycle: float = (now - last_cycle_started_at)
-        # fix variables for empty timers
-        # and notify listeners if necessary
-        for key, value in self.__timers.items():
-            if value[1] - time_difference_since_last_cycle < 0:
-                self.variables[key] = "--"
-                self.__notify_listeners(key_name=key, old_value=value[0], new_value=0)
-        # remove all timers that are zero and below
-        # OR keep all the others to be precise
-        # that's the reason for the >=0 in the comprehension
-        self.__timers = {
-            k: v for k, v in self.__timers.items()
-            if v[1] - time_difference_since_last_cycle >= 0
-        }
-        # recalculate all timers - remember the timers are values are pairs of floats
-        self.__timers = {
-            k: [v[0], v[1] - time_difference_since_last_cycle]
-            for k, v in self.__timers.items()
-        }
-        # re-set all variables
-        for key, value in self.__timers.items():
-            self.log.trace(f"time {key} is now {value[1]}")
-            pattern = "%M:%S" if value[1] < 3600000 else "%H:%M:%S"
-            new_time_value = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(
-                milliseconds=value[1])
-            self.variables[key] = new_time_value.strftime(pattern)
-            # this event will be sent out to realize a Progress Bar via the LEDs.
-            self.__notify_listeners(key_name=key, old_value=value[0], new_value=value[1])
-
-    def set_timer(self, key: str, time_in_secs: int):
-        self.log.trace(f"setting timer {key} to {time_in_secs}")
-        # we have to add one second here so the display matches what the player expects to see on the display
-        initial_value = (time_in_secs + 1) * 1000
-        # left Long = starting value -> never changes
-        # right Long = decreasing value ends with 0
-        self.__timers[key] = [initial_value, initial_value]
-
-    def clear_timers(self):
-        for key in self.__timers.keys():
-            self.variables[key] = "--"
-        self.__timers.clear()
-
-    def replace_variables(self, line: str) -> str:
-        text = line
-        for key, value in self.variables.items():
-            # log.debug(f"before {text}")
-            # log.debug(f"replacing ${{{key}}} with {value}")
-            text = text.replace(f"${{{key}}}", str(value))
-        # log.debug(f"after {text}")
-        return text
-
-    # https://www.educba.com/python-event-handler/
-    def __iadd__(self, e_handler):
-        self.__timer_listeners.append(e_handler)
-        return self
-
-    def __isub__(self, e_handler):
-        self.__timer_listeners.remove(e_handler)
-        return self
-
-    def __notify_listeners(self, key_name=None, old_value=None, new_value=None):
-        for listener in self.__timer_listeners:
-            listener(key_name=key_name, old_value=old_value, new_value=new_value)
-
     def set_wifi_vars(self, signal_quality: int):
         """
         sets the variables for wi-fi signal in percentage and for the LCD (special char is
-        user defined in my_lcd.py - hence the \x01 ... \x05 macro)
+        user defined in lcd_writer.py - hence the \x01 ... \x05 macro)
 
         :param signal_quality: in percentage
         """
@@ -211,6 +193,8 @@ class Context:
             wifi_symbol = "\x04"
         if signal_quality >= 80:
             wifi_symbol = "\x05"
-        self.variables["wifi"] = f"{signal_quality}%"
-        # x00 is the antenna symbol
-        self.variables["wifi_signal"] = f"\x00{wifi_symbol}"
+        self.variables.update({
+            "wifi": f"{signal_quality}%",
+            # x00 is the antenna symbol
+            "wifi_signal": f"\x00{wifi_symbol}"
+        })
@@ -0,0 +1,79 @@
+import threading
+
+
+class VariableStore:
+    """
+    thread-safe store for the variables (e.g. for the LCD). it can be used like a dict.
+    every real change increases the global version and the version of the changed key.
+    subscribers are called with the names of the changed keys.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__values: {str: str} = {}
+        self.__versions: {str: int} = {}
+        # increased with every change of any key
+        self.version: int = 0
+        # pairs of (callback, keys). keys is None for subscribers to all keys.
+        self.__subscribers: [(callable, frozenset | None)] = []
+
+    def __getitem__(self, key: str):
+        return self.__values[key]
+
+    def __setitem__(self, key: str, value):
+        self.update({key: value})
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__values
+
+    def get(self, key: str, default=None):
+        return self.__values.get(key, default)
+
+    def items(self):
+        return self.snapshot().items()
+
+    def snapshot(self) -> {str: str}:
+        """
+        :return: a consistent copy of all variables
+        """
+        with self.__lock:
+            return dict(self.__values)
+
+    def key_version(self, key: str) -> int:
+        """
+        :return: the global version of the last change of this key. 0 if it has never been set.
+        """
+        return self.__versions.get(key, 0)
+
+    def update(self, values: {str: str}):
+        """
+        sets several variables at once. subscribers are notified once, after all of them are set.
+        """
+        changed: set[str] = set()
+        with self.__lock:
+            for key, value in values.items():
+                if key in self.__values and self.__values[key] == value:
+                    continue
+                self.version += 1
+                self.__values[key] = value
+                self.__versions[key] = self.version
+                changed.add(key)
+            subscribers = list(self.__subscribers)
+        if not changed:
+            return
+        # outside the lock - a callback may read or write the store again
+        for callback, keys in subscribers:
+            if keys is None or not keys.isdisjoint(changed):
+                callback(changed)
+
+    def subscribe(self, callback, keys: [str] = None):
+        """
+        :param callback: called with the set of changed keys on the thread that made the change
+        :param keys: only changes of these keys are reported. None for all keys.
+        """
+        with self.__lock:
+            self.__subscribers.append((callback, None if keys is None else frozenset(keys)))
+
+    def unsubscribe(self, callback):
+        with self.__lock:
+            self.__subscribers = [(cb, keys) for cb, keys in self.__subscribers if cb != callback]